@@ -10,12 +10,16 @@ GitHub: https://github.com/Br41nfck/Find-Comments
   --ext EXT [EXT ...]               Какие расширения файлов анализировать
   --ignore WORD [...]               Не анализировать файлы, если в имени есть эти слова
   --ignore-regex REGEX              Не анализировать файлы, если имя подходит под regex
+  --ignore-dir NAME [...]           Не заходить в каталоги с такими именами (например, venv build dist)
+  --include-hidden                  Обходить и скрытые каталоги, node_modules, __pycache__ (по умолчанию пропускаются)
   --only TYPE [...]                 Искать только определённые типы комментариев: single, multi, triple_slash, warning
   --contains PATTERN [PATTERN ...]  Только комментарии, содержащие слова/regex
   --min-lines N                     Только блоки длиннее N строк
   --show-progress                   Показывать прогресс (по умолчанию)
   --no-progress                     Не показывать прогресс
   --workers N                       Сколько потоков использовать (по умолчанию 4)
+  --executor TYPE                   Пул для анализа: thread или process (по умолчанию process при --workers > 1)
+  --cache-verify                    Проверять кэш по хэшу содержимого, а не по времени изменения и размеру
   --out FILE                        Куда сохранить результат
   --format FMT                      Формат вывода: prettytxt, txt, csv, json, html
   --include-symbols                 Оставлять символы комментариев и теги (///, //, #, <summary> и др.)
@@ -32,6 +36,7 @@ GitHub: https://github.com/Br41nfck/Find-Comments
   --interactive                     Интерактивный просмотр
   --support-lang                    Показать поддерживаемые языки и форматы комментариев и выйти
   --edit FILE LINE                  Открыть файл в редакторе на нужной строке и выйти
+  --version                         Показать версию и выйти
 
 
 Возможности:
@@ -71,65 +76,28 @@ GitHub: https://github.com/Br41nfck/Find-Comments
 
 """
 
+# Здесь только модули, нужные при каждом запуске и при анализе файлов.
+# Остальные (csv, glob, subprocess, concurrent.futures и т.д.) импортируются в функциях,
+# которые их используют, чтобы --help и --support-lang запускались быстрее
 import os
 import re
 import argparse
 import json
-import csv
 import hashlib
-import datetime
 import locale
-import math
-import textwrap
 import sys
-import glob
-import importlib.util
-import subprocess
-import shutil
-from collections import Counter, defaultdict
-from html import escape
-from colorama import init, Fore, Style as ColoramaStyle
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-try:
-    import openpyxl
-    from openpyxl.styles import Font
-except ImportError:
-    openpyxl = None
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-except ImportError:
-    A4 = canvas = mm = getSampleStyleSheet = SimpleDocTemplate = Paragraph = Spacer = Table = TableStyle = colors = None
-try:
-    from prompt_toolkit.application import Application
-    from prompt_toolkit.key_binding import KeyBindings
-    from prompt_toolkit.layout import Layout
-    from prompt_toolkit.layout.containers import HSplit, Window
-    from prompt_toolkit.layout.controls import FormattedTextControl
-    from prompt_toolkit.widgets import Frame
-    from prompt_toolkit.styles import Style
-    from prompt_toolkit.formatted_text import HTML
-    from prompt_toolkit.shortcuts.dialogs import checkboxlist_dialog
-    from prompt_toolkit.shortcuts import input_dialog, message_dialog
-except ImportError:
-    Application = KeyBindings = Layout = HSplit = Window = FormattedTextControl = Frame = Style = HTML = checkboxlist_dialog = input_dialog = message_dialog = None
-try:
-    from rich.console import Console
-    from rich.syntax import Syntax
-    from rich.text import Text
-except ImportError:
-    Console = Syntax = Text = None
-try:
-    import pyperclip
-except ImportError:
-    pyperclip = None
-import io
+import sqlite3
+import mmap
+import time
+from collections import Counter, defaultdict, namedtuple
+from functools import lru_cache
 
+VERSION = '1.0'
+
+
+# Найденный комментарий: файл, первая и последняя строки, текст и тип ('single', 'multi' или 'warning').
+# namedtuple дешевле словаря по памяти и времени создания, а комментариев в большом проекте — миллионы
+Comment = namedtuple('Comment', 'file line end_line text type')
 
 # Словарь: расширение -> список паттернов комментариев (однострочные, многострочные)
 COMMENT_PATTERNS = {
@@ -240,6 +208,104 @@ COMMENT_PATTERNS = {
     ],
 }
 
+REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]|()')
+
+def regex_literal(source):
+    """
+    Если регулярное выражение source — обычная строка без спецсимволов (например, /\\*),
+    возвращает эту строку без экранирования. Иначе возвращает None.
+    """
+    chars = []
+    i = 0
+    while i < len(source):
+        ch = source[i]
+        if ch == '\\':
+            if i + 1 >= len(source) or source[i + 1].isalnum():
+                return None
+            chars.append(source[i + 1])
+            i += 2
+            continue
+        if ch in REGEX_SPECIAL_CHARS:
+            return None
+        chars.append(ch)
+        i += 1
+    literal = ''.join(chars)
+    # Маркер с переводом строки построчно не совпадает никогда — оставляем его регулярке
+    return literal if literal and '\n' not in literal else None
+
+@lru_cache(maxsize=None)
+def optional_module(name):
+    """
+    Импортирует необязательный пакет (orjson, xxhash и т.п.) при первом обращении к нему, а не при запуске:
+    --help, --version и --support-lang их не загружают. Возвращает модуль или None, если пакет не установлен;
+    результат запоминается, поэтому отсутствующий пакет не ищется повторно.
+    """
+    import importlib
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+@lru_cache(maxsize=None)
+def re2_options():
+    """
+    Возвращает настройки re2 (без вывода ошибок компиляции в stderr) или None, если re2 не установлен.
+    re2 загружается при первой регулярке, которой он нужен, а не при запуске.
+    """
+    re2 = optional_module('re2')
+    if re2 is None:
+        return None
+    options = re2.Options()
+    options.log_errors = False
+    return options
+
+def compile_regex(source):
+    """
+    Компилирует регулярку комментария через re2 (DFA: линейное время, без катастрофического бэктрекинга
+    на паттернах из плагинов), если он установлен. То, что re2 не поддерживает (обратные ссылки,
+    lookaround), компилируется через стандартный re.
+    """
+    options = re2_options()
+    if options is not None:
+        re2 = optional_module('re2')
+        try:
+            return re2.compile(source, options)
+        except re2.error:
+            pass
+    return re.compile(source)
+
+def compile_pattern(pat):
+    """
+    Возвращает копию паттерна, в которой строки 'pattern'/'start'/'end' заменены скомпилированными регулярками.
+    Для паттернов-литералов дополнительно сохраняет literal_start/literal_end/literal_prefix,
+    чтобы искать их через str.find вместо регулярок.
+    """
+    compiled = dict(pat)
+    for key in ('start', 'end'):
+        if isinstance(compiled.get(key), str):
+            compiled['literal_' + key] = regex_literal(compiled[key])
+    if isinstance(compiled.get('pattern'), str) and compiled['pattern'].endswith('.*'):
+        # Однострочный комментарий вида "<маркер>.*" — достаточно найти маркер
+        compiled['literal_prefix'] = regex_literal(compiled['pattern'][:-2])
+    # Маркер-литерал ищется через str.find, регулярка от него нужна лишь для .pattern (--support-lang):
+    # её компилирует стандартный re, а re2 достаётся только настоящим регуляркам (из плагинов)
+    literal_keys = {'pattern': 'literal_prefix', 'start': 'literal_start', 'end': 'literal_end'}
+    for key in ('pattern', 'start', 'end'):
+        if isinstance(compiled.get(key), str):
+            compiled[key] = (re.compile if compiled.get(literal_keys[key]) else compile_regex)(compiled[key])
+    return compiled
+
+# Компилируем паттерны один раз при загрузке модуля, а не для каждого файла
+COMMENT_PATTERNS = {ext: [compile_pattern(p) for p in pats] for ext, pats in COMMENT_PATTERNS.items()}
+
+# Регулярка для удаления XML-тегов <summary> из строк комментариев
+SUMMARY_TAG_RE = re.compile(r'<\/?summary>', re.IGNORECASE)
+# Регулярки интерактивного просмотра: символы комментария в начале строки, любые теги,
+# первый маркер комментария в строке кода (с него строка подсвечивается как комментарий)
+DISPLAY_PREFIX_RE = re.compile(r'^\s*(///+|//+|#+|/\*+|\*+/|<!--+|-->|<summary>|</summary>)', re.IGNORECASE)
+DISPLAY_TAG_RE = re.compile(r'<.*?>')
+COMMENT_MARKER_RE = re.compile(r'(//|#|/\*|<!--|-->)')
+
 LOCALES = {
     'en': {
         'files': 'Files',
@@ -257,7 +323,11 @@ LOCALES = {
         'help_show_progress': 'Show progress (default)',
         'help_no_progress': 'Do not show progress',
         'help_workers': 'Number of parallel workers (default: 4)',
+        'help_executor': 'Worker pool type: thread or process (default: process if --workers > 1)',
+        'help_cache_verify': 'Validate cache entries by file content hash instead of modification time and size',
         'help_ignore_regex': 'Regex pattern to ignore files by name',
+        'help_ignore_dir': 'Directory names to skip entirely while walking (e.g. venv build dist)',
+        'help_include_hidden': 'Also walk hidden directories (.github, .vscode, ...), node_modules and __pycache__, which are skipped by default',
         'help_contains': 'Only show comments containing these words or regexes',
         'help_fail_on': 'Exit with error if any comment contains these words or regexes',
         'help_show_content': 'Show only comment text (no file/line info)',
@@ -293,7 +363,11 @@ LOCALES = {
         'help_show_progress': 'Показывать прогресс (по умолчанию)',
         'help_no_progress': 'Не показывать прогресс',
         'help_workers': 'Количество параллельных потоков (по умолчанию: 4)',
+        'help_executor': 'Тип пула: thread (потоки) или process (процессы; по умолчанию при --workers > 1)',
+        'help_cache_verify': 'Проверять кэш по хэшу содержимого файла, а не по времени изменения и размеру',
         'help_ignore_regex': 'Регулярное выражение для игнорирования файлов по имени',
+        'help_ignore_dir': 'Имена каталогов, в которые не заходить при обходе (например, venv build dist)',
+        'help_include_hidden': 'Обходить и скрытые каталоги (.github, .vscode, ...), node_modules и __pycache__, которые по умолчанию пропускаются',
         'help_contains': 'Показывать только комментарии, содержащие эти слова или regex',
         'help_fail_on': 'Завершать с ошибкой, если найден комментарий с этими словами или regex',
         'help_show_content': 'Показывать только текст комментариев (без файла/строк)',
@@ -305,7 +379,7 @@ LOCALES = {
         'help_files': 'Список файлов для анализа (заменяет --root, --ext и др.)',
         'help_filelist': 'Путь к файлу со списком файлов для анализа (по одному в строке)',
         'help_highlight': 'Подсвечивать эти слова в выводе (без учёта регистра)',
-        'help_max_depth': 'Максимальная глубина рекурсивного обхода директорий (по умолчанию: неограниченная)',
+        'help_max_depth': 'Максимальная глубина рекурсивного обхода директорий (по умолчанию: только текущая папка)',
         'help_plugin': 'Пути к .py-файлам плагинов (каждый должен экспортировать get_patterns())',
         'help_report': 'Экспортировать аналитический отчёт (md, csv, txt, html, xlsx, pdf, json)',
         'help_report_out': 'Файл для сохранения отчёта (по умолчанию — вывод в консоль)',
@@ -351,183 +425,591 @@ def get_patterns_for_ext(ext, plugin_patterns=None):
     """
     Возвращает список паттернов комментариев для расширения файла ext, включая плагины.
     """
-    pats = COMMENT_PATTERNS.get(ext, []).copy()
+    pats = COMMENT_PATTERNS.get(ext, [])
     if plugin_patterns and ext in plugin_patterns:
-        pats.extend(plugin_patterns[ext])
+        # Встроенный список не копируем, если плагины для расширения не заданы
+        pats = pats + plugin_patterns[ext]
     return pats
 
-def find_comments_in_file(filepath, patterns):
+# Файлы крупнее порога (минифицированные бандлы и т.п.) отображаются в память через mmap
+# и просматриваются как байты, без копии в куче. Меньшие файлы дешевле прочитать целиком:
+# подсчёт строк по mmap идёт через срезы и заметно медленнее
+MMAP_THRESHOLD = 1 << 20
+# Одиночный '\r' (старые переводы строк Mac) — такие файлы разбираются через декодированный текст
+BARE_CR_RE = re.compile(rb'\r(?!\n)')
+# Размер среза, по которому считаются переводы строк в mmap
+MMAP_COUNT_CHUNK = 1 << 20
+
+def count_newlines(buf, start, end):
+    """
+    Считает переводы строк в buf[start:end]. У mmap нет метода count, поэтому для него считается
+    по срезам не длиннее MMAP_COUNT_CHUNK — большой файл целиком в кучу не копируется.
+    """
+    if isinstance(buf, str):
+        return buf.count('\n', start, end)
+    if isinstance(buf, bytes):
+        return buf.count(b'\n', start, end)
+    return sum(buf[i:min(i + MMAP_COUNT_CHUNK, end)].count(b'\n') for i in range(start, end, MMAP_COUNT_CHUNK))
+
+def count_lines(buf):
+    """
+    Возвращает число строк в buf так же, как len(readlines()) при чтении в текстовом режиме:
+    последняя строка без перевода строки тоже считается. Одиночных '\r' в buf быть не должно.
+    """
+    size = len(buf)
+    if not size:
+        return 0
+    return count_newlines(buf, 0, size) + (buf[-1:] not in ('\n', b'\n'))
+
+def is_utf8(buf):
+    """
+    Проверяет, что buf — корректный UTF-8. Поиск по байтам даёт тот же результат, что и по тексту,
+    декодированному с errors='ignore', только когда выбрасывать нечего: иначе удалённые байты
+    могут склеить маркер (/\xff/ -> //) или убрать последнюю строку. ASCII проверяется без декодирования,
+    mmap декодируется по срезам не длиннее MMAP_COUNT_CHUNK.
+    """
+    import codecs
+    if isinstance(buf, bytes):
+        if buf.isascii():
+            return True
+        chunks = (buf,)
+    else:
+        chunks = (buf[i:i + MMAP_COUNT_CHUNK] for i in range(0, len(buf), MMAP_COUNT_CHUNK))
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for chunk in chunks:
+            if not chunk.isascii() or decoder.getstate()[0]:
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def buffer_text(buf, start, end=None):
+    """
+    Возвращает фрагмент buf[start:end] строкой. Байты из mmap декодируются,
+    '\\r\\n' приводится к '\\n', как при чтении файла в текстовом режиме.
+    """
+    chunk = buf[start:end]
+    if isinstance(chunk, str):
+        return chunk
+    text = chunk.decode('utf-8', errors='ignore')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+        # Фрагмент, обрезанный по концу строки, заканчивается на '\r' от пары '\r\n'
+        if text.endswith('\r'):
+            text = text[:-1]
+    return text
+
+def find_marker_lines(text, literal=None, regex=None):
+    """
+    Находит строки текста, в которых встречается маркер комментария.
+    Литерал ищется по всему тексту (str, bytes или mmap) через find, номер строки считается
+    по числу переводов строки между совпадениями; регулярное выражение проверяется построчно.
+    Возвращает словарь {номер строки: (начало строки, конец строки, начало совпадения, конец совпадения)}
+    в порядке возрастания номеров строк.
+    """
+    found = {}
+    if literal:
+        nl = '\n' if isinstance(text, str) else b'\n'
+        count = text.count if isinstance(text, (str, bytes)) else (lambda sub, start, end: count_newlines(text, start, end))
+        line_no = 1
+        counted = 0
+        pos = text.find(literal)
+        while pos >= 0:
+            line_no += count(nl, counted, pos)
+            counted = pos
+            start = text.rfind(nl, 0, pos) + 1
+            end = text.find(nl, pos)
+            if end < 0:
+                end = len(text)
+            found[line_no] = (start, end, pos, pos + len(literal))
+            # Нужна только первая встреча в строке — продолжаем со следующей
+            pos = text.find(literal, end)
+        return found
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    start = 0
+    for line_no, line in enumerate(lines, 1):
+        m = regex.search(line)
+        if m:
+            found[line_no] = (start, start + len(line), start + m.start(), start + m.end())
+        start += len(line) + 1
+    return found
+
+def find_comments_in_file(filepath, patterns, with_lines=False):
     """
     Находит все комментарии в файле по заданным паттернам.
-    Возвращает список словарей с информацией о комментариях: файл, строки, текст и тип.
+    Файл читается целиком как байты (крупный — через mmap), маркеры ищутся по всему содержимому сразу,
+    а номера строк вычисляются по смещениям совпадений — без цикла по каждой строке в Python.
+    Если все маркеры — литералы, а файл — корректный UTF-8, файл целиком не декодируется: в str переводятся
+    только найденные комментарии. Файл с битыми байтами разбирается по тексту, декодированному с errors='ignore'.
+    Возвращает кортеж (комментарии, число строк в файле): комментарии — список Comment (файл, строки, текст и тип),
+    число строк считается только с with_lines=True (оно нужно отчёту --report, чтобы не читать файл повторно),
+    иначе и при ошибке чтения — None.
     """
-    results = []
+    # Путь общий для всех комментариев файла — храним одну интернированную строку
+    filepath = sys.intern(filepath)
+    # Если все открывающие маркеры — литералы, файл без их первых символов можно
+    # отбросить до декодирования: проверка выполняется на C
+    start_literals = [
+        pat.get('literal_start') if pat['type'] == 'multi' else pat.get('literal_prefix')
+        for pat in patterns
+    ]
+    marker_chars = {lit[0] for lit in start_literals} if all(start_literals) else None
+    # Поиск по байтам (и по mmap) возможен, только если все маркеры — литералы
+    all_literal = marker_chars is not None and all(
+        pat.get('literal_end') for pat in patterns if pat['type'] == 'multi'
+    )
+
+    count = count_lines if with_lines else (lambda buf: None)
+
     try:
-        with open(filepath, encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-    except Exception as e:
-        return results
-    
-    # Для многострочных комментариев
+        with open(filepath, 'rb') as f:
+            if all_literal and os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Файл с одиночными '\r' или битыми байтами читается целиком и разбирается как текст ниже
+                    if not BARE_CR_RE.search(mm) and is_utf8(mm):
+                        if not any(mm.find(ch.encode('utf-8')) >= 0 for ch in marker_chars):
+                            return [], count(mm)
+                        return find_comments_in_buffer(filepath, patterns, mm), count(mm)
+            data = f.read()
+    # Файл не читается (нет прав, удалён) или обрезан до нуля между fstat и mmap
+    except (OSError, ValueError):
+        return [], None
+    # Быстрый отсев: если в файле нет ни одного первого символа маркеров, комментариев в нём нет
+    no_markers = marker_chars and not any(ch.encode('utf-8') in data for ch in marker_chars)
+    if no_markers and not with_lines:
+        return [], None
+    # Байты разбираются напрямую, только если они совпадают с текстом, который дал бы decode(errors='ignore')
+    if (all_literal or no_markers) and not (b'\r' in data and BARE_CR_RE.search(data)) and is_utf8(data):
+        if no_markers:
+            return [], count(data)
+        return find_comments_in_buffer(filepath, patterns, data), count(data)
+    text = data.decode('utf-8', errors='ignore')
+    # Переводы строк приводим к '\n', как это делает open() в текстовом режиме
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if no_markers:
+        return [], count(text)
+    return find_comments_in_buffer(filepath, patterns, text), count(text)
+
+def find_comments_in_buffer(filepath, patterns, buf):
+    """
+    Ищет комментарии в уже прочитанном содержимом файла: в байтах (bytes или mmap) —
+    тогда литеральные маркеры кодируются в UTF-8, а декодируются только найденные фрагменты, —
+    или в декодированной строке (str), если среди маркеров есть регулярные выражения.
+    Возвращает комментарии в порядке номеров строк.
+    """
+    encoded = not isinstance(buf, str)
+    found_by_literal = {}
+
+    def marker_lines(literal, regex):
+        if not literal:
+            return find_marker_lines(buf, None, regex)
+        if encoded:
+            literal = literal.encode('utf-8')
+        if literal in found_by_literal:
+            return found_by_literal[literal]
+        # Литерал, содержащий уже найденный маркер (/// и //), может встретиться только в его строках:
+        # ищем его в этих строках, а не ещё одним проходом по всему тексту
+        for known, known_lines in found_by_literal.items():
+            if known in literal:
+                found = {}
+                for line_no, (start, end, _, _) in known_lines.items():
+                    pos = buf.find(literal, start, end)
+                    if pos >= 0:
+                        found[line_no] = (start, end, pos, pos + len(literal))
+                break
+        else:
+            found = find_marker_lines(buf, literal)
+        found_by_literal[literal] = found
+        return found
+
+    # Порядок результатов прежний: сначала многострочные паттерны, потом однострочные
+    multi_results = []
+    single_results = []
     for pat in patterns:
         if pat['type'] == 'multi':
-            start_pat = re.compile(pat['start'])
-            end_pat = re.compile(pat['end'])
+            starts = marker_lines(pat.get('literal_start'), pat['start'])
+            if pat['start'].pattern == pat['end'].pattern:
+                ends = starts
+            else:
+                ends = marker_lines(pat.get('literal_end'), pat['end'])
+            same_markers = ends is starts
             inside = False
-            comment_lines = []
-            start_line = 0
-            for idx, line in enumerate(lines):
-                if not inside and start_pat.search(line):
+            for line_no in sorted(starts.keys() | ends.keys()):
+                if not inside:
+                    if line_no not in starts:
+                        continue
                     inside = True
-                    start_line = idx + 1
-                    comment_lines = [line.rstrip('\n')]
-                    if end_pat.search(line) and start_pat.pattern != end_pat.pattern:
-                        
+                    start_line = line_no
+                    block_start = starts[line_no][0]
+                    if not same_markers and line_no in ends:
                         # Однострочный многострочный комментарий
-                        results.append({
-                            'file': filepath,
-                            'line': start_line,
-                            'end_line': idx + 1,
-                            'text': line.strip(),
-                            'type': 'multi',
-                        })
-                        inside = False
-                        comment_lines = []
-                elif inside:
-                    comment_lines.append(line.rstrip('\n'))
-                    if end_pat.search(line):
-                        results.append({
-                            'file': filepath,
-                            'line': start_line,
-                            'end_line': idx + 1,
-                            'text': '\n'.join(comment_lines),
-                            'type': 'multi',
-                        })
+                        line_start, line_end = starts[line_no][:2]
+                        multi_results.append(Comment(filepath, line_no, line_no, buffer_text(buf, line_start, line_end).strip(), 'multi'))
                         inside = False
-                        comment_lines = []
-            
+                elif line_no in ends:
+                    multi_results.append(Comment(filepath, start_line, line_no, buffer_text(buf, block_start, ends[line_no][1]), 'multi'))
+                    inside = False
             # Если файл закончился, а комментарий не закрыт
             if inside:
-                results.append({
-                    'file': filepath,
-                    'line': start_line,
-                    'end_line': len(lines),
-                    'text': '\n'.join(comment_lines) + '\n[WARNING: Многострочный комментарий не закрыт!]',
-                    'type': 'warning',
-                })
-    
-    # Для однострочных комментариев
-    for pat in patterns:
-        if pat['type'] == 'single':
-            regex = re.compile(pat['pattern'])
-            for idx, line in enumerate(lines):
-                m = regex.search(line)
-                if m:
-                    results.append({
-                        'file': filepath,
-                        'line': idx + 1,
-                        'end_line': idx + 1,
-                        'text': m.group().strip(),
-                        'type': 'single',
-                    })
+                size = len(buf)
+                line_count = count_newlines(buf, 0, size)
+                if size and buf[size - 1:] not in ('\n', b'\n'):
+                    line_count += 1
+                block = buffer_text(buf, block_start)
+                if block.endswith('\n'):
+                    block = block[:-1]
+                multi_results.append(Comment(filepath, start_line, line_count, block + '\n[WARNING: Многострочный комментарий не закрыт!]', 'warning'))
+        elif pat['type'] == 'single':
+            prefix = pat.get('literal_prefix')
+            for line_no, (line_start, line_end, match_start, match_end) in marker_lines(prefix, pat['pattern']).items():
+                # Литеральный префикс соответствует паттерну `префикс.*` — до конца строки
+                text = buf[match_start:line_end if prefix else match_end]
+                if encoded:
+                    # Переводов строк внутри нет, а '\r' от '\r\n' в конце уберёт strip()
+                    text = text.decode('utf-8', errors='ignore')
+                single_results.append(Comment(filepath, line_no, line_no, text.strip(), 'single'))
+    # Сортировка устойчивая: на одной строке многострочный комментарий остаётся перед однострочным
+    results = multi_results + single_results
+    results.sort(key=lambda c: c.line)
     return results
 
+# Файлы крупнее этого размера хэшируются через mmap, без копирования в буферы чтения
+HASH_MMAP_SIZE = 16 * 1024 * 1024
+
 def file_hash(filepath):
     """
-    Вычисляет SHA256-хэш содержимого файла.
-    Используется для кэширования результатов анализа.
+    Вычисляет хэш содержимого файла: xxh3_64, если установлен xxhash, иначе BLAKE2b
+    (без SHA-NI он в 2–3 раза быстрее SHA256). Криптостойкость здесь не нужна — хэш используется
+    только как ключ кэша. Файл читается hashlib.file_digest, крупный — отображается в память.
     """
-    h = hashlib.sha256()
+    xxhash = optional_module('xxhash')
+    digest = xxhash.xxh3_64 if xxhash else hashlib.blake2b
     try:
-        with open(filepath, 'rb') as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                h.update(chunk)
-        return h.hexdigest()
+        with open(filepath, 'rb', buffering=0) as f:
+            if os.fstat(f.fileno()).st_size > HASH_MMAP_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return digest(mm).hexdigest()
+            return hashlib.file_digest(f, digest).hexdigest()
     except Exception:
         return None
 
-def load_cache(cache_path):
+def dump_json(obj, indent=False):
+    """
+    Сериализует obj в JSON-строку без экранирования не-ASCII символов:
+    через orjson, если он установлен (в разы быстрее), иначе стандартным json.
+    """
+    orjson = optional_module('orjson')
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+def write_json(obj, filename):
+    """
+    Записывает obj в JSON-файл с отступом в 2 пробела. orjson отдаёт сразу байты UTF-8,
+    поэтому файл в этом случае пишется в двоичном режиме.
+    """
+    orjson = optional_module('orjson')
+    if orjson:
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+
+def open_cache(cache_path):
+    """
+    Открывает (и при необходимости создаёт) SQLite-базу кэша cache_path.
+    Каждый файл — отдельная строка таблицы, поэтому кэш не нужно целиком читать и перезаписывать.
+    Если базу открыть не удалось — возвращает None, анализ продолжается без кэша.
+    """
+    try:
+        conn = sqlite3.connect(cache_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # В режиме WAL база не портится и без fsync на каждую транзакцию; при сбое питания
+        # теряется разве что последнее сохранение кэша — файлы просто будут разобраны заново
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, digest TEXT, comments TEXT, lines INTEGER)'
+        )
+        # Базы прежних версий без числа строк дополняем столбцом; у старых записей он пустой
+        if 'lines' not in {row[1] for row in conn.execute('PRAGMA table_info(cache)')}:
+            conn.execute('ALTER TABLE cache ADD COLUMN lines INTEGER')
+        return conn
+    except sqlite3.Error:
+        return None
+
+def load_cache(conn):
     """
-    Загружает кэш из файла cache_path.
-    Если файла нет — возвращает пустой словарь.
+    Загружает из кэша ключи всех файлов (без комментариев): {путь: {'mtime_ns', 'size', 'digest', 'lines'}}.
     """
     try:
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
+        rows = conn.execute('SELECT path, mtime_ns, size, digest, lines FROM cache').fetchall()
+    except sqlite3.Error:
         return {}
+    return {
+        path: {'mtime_ns': mtime_ns, 'size': size, 'digest': digest, 'lines': lines}
+        for path, mtime_ns, size, digest, lines in rows
+    }
 
-def save_cache(cache_path, cache):
+def load_cached_comments(conn, filepath):
     """
-    Сохраняет кэш в файл cache_path.
+    Возвращает закэшированные комментарии файла (список Comment) или None, если записи нет
+    или она в старом формате. Комментарии разбираются из JSON только для файлов, попавших в кэш.
     """
     try:
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2)
-    except Exception:
+        row = conn.execute('SELECT comments FROM cache WHERE path = ?', (filepath,)).fetchone()
+        if not row:
+            return None
+        filepath = sys.intern(filepath)
+        orjson = optional_module('orjson')
+        return [
+            Comment(filepath, line, end_line, text, comment_type)
+            for line, end_line, text, comment_type in (orjson.loads if orjson else json.loads)(row[0])
+        ]
+    except (sqlite3.Error, ValueError, TypeError):
+        return None
+
+def save_cache(conn, entries):
+    """
+    Записывает изменённые записи кэша {путь: {'mtime_ns', 'size', 'digest', 'comments', 'lines'}} одной транзакцией.
+    Комментарии хранятся списками [строка, последняя строка, текст, тип] — путь уже есть в ключе записи.
+    """
+    rows = [
+        (path, e['mtime_ns'], e['size'], e.get('digest'), dump_json([c[1:] for c in e['comments']]), e.get('lines'))
+        for path, e in entries.items()
+    ]
+    try:
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache (path, mtime_ns, size, digest, comments, lines) VALUES (?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+    except sqlite3.Error:
         pass
 
-def scan_dir(root, extensions, ignore_words=None, ignore_regex=None, show_progress=True, workers=4, use_cache=True, cache_path='.comments_cache.json', max_depth=None, plugin_patterns=None):
+def file_cache_key(filepath, cached=None, verify=False):
     """
-    Сканирует директорию root и все поддиректории до max_depth.
-    Возвращает кортеж: (все_комментарии, все_файлы, ошибки_чтения).
+    Возвращает (ключ, попадание): ключ кэша для файла — {'mtime_ns', 'size'} и, если verify=True,
+    'digest'; попадание — можно ли взять комментарии из записи кэша cached.
+    Без verify файл не читается: достаточно os.stat. С verify сравнивается хэш содержимого,
+    поэтому файл, у которого изменилось только время модификации, тоже считается попаданием.
     """
-    if ignore_words is None:
-        ignore_words = []
-    ignore_re = re.compile(ignore_regex) if ignore_regex else None
-    all_files = []
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None, False
+    key = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+    if not verify:
+        hit = bool(cached) and cached.get('mtime_ns') == key['mtime_ns'] and cached.get('size') == key['size']
+        return key, hit
+    key['digest'] = file_hash(filepath)
+    hit = bool(cached) and key['digest'] is not None and cached.get('digest') == key['digest']
+    return key, hit
+
+def process_file(filepath, patterns, cached=None, use_cache=True, verify_cache=False, with_lines=False):
+    """
+    Анализирует один файл. Объявлена на уровне модуля, чтобы её можно было передать в пул процессов.
+    patterns — паттерны для расширения файла (см. get_patterns_for_ext),
+    cached — ключ из записи кэша для этого файла (без комментариев).
+    Возвращает кортеж (путь, ключ_кэша, комментарии, число_строк, ошибка). При попадании в кэш вместо
+    комментариев и числа строк возвращается None — их нужно взять из кэша в основном процессе.
+    """
+    if not patterns:
+        return filepath, None, [], None, None
+    key = None
+    if use_cache:
+        key, hit = file_cache_key(filepath, cached, verify_cache)
+        if hit:
+            return filepath, key, None, None, None
+    try:
+        return filepath, key, *find_comments_in_file(filepath, patterns, with_lines), None
+    except Exception as e:
+        return filepath, key, [], None, f"{filepath}: {e}"
+
+# Минимальный интервал между обновлениями строки прогресса (не чаще 10 раз в секунду)
+PROGRESS_INTERVAL = 0.1
+# Меньше этого числа файлов анализируются прямо в основном процессе, без пула
+INLINE_SCAN_LIMIT = 32
+
+def scan_files(files, plugin_patterns=None, workers=4, executor=None, use_cache=True, cache_path='.comments_cache.db', show_progress=False, verify_cache=False, with_lines=False):
+    """
+    Анализирует файлы — список пар (путь, расширение в нижнем регистре) — в пуле потоков или процессов (executor: 'thread' или 'process';
+    по умолчанию процессы, если workers > 1; меньше INLINE_SCAN_LIMIT файлов — без пула). Кэш читается и обновляется только в основном процессе.
+    Записи кэша сверяются по времени модификации и размеру файла, с verify_cache=True — по хэшу содержимого.
+    Прогресс (show_progress=True) выводит только основной поток одной обновляемой строкой
+    не чаще PROGRESS_INTERVAL секунд — рабочие потоки в stdout не пишут и не ждут его блокировку.
+    Возвращает кортеж: (все_комментарии, ошибки_чтения, число_строк). Комментарии упорядочены по (файл, строка);
+    число_строк — словарь
+    {путь: строк в файле}; с with_lines=True в него попадают разобранные файлы, а также записи кэша,
+    где число строк сохранено.
+    """
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+    if executor is None:
+        executor = 'process' if workers > 1 else 'thread'
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    # Комментарии каждого файла уже упорядочены по строкам; файлы собираются в словарь и в конце
+    # склеиваются в порядке путей — group_comments получает уже отсортированный список
+    comments_by_file = {}
     errors = []
-    root_depth = root.rstrip(os.sep).count(os.sep)
+    file_lines = {}
+    conn = open_cache(cache_path) if use_cache else None
+    cache = load_cache(conn) if conn else {}
+    changed = {}
+    # Паттерны подбираются один раз на расширение, а не для каждого файла
+    patterns_by_ext = {ext: get_patterns_for_ext(ext, plugin_patterns=plugin_patterns) for ext in {ext for _, ext in files}}
+    file_exts = dict(files)
+    tasks = []
+    for filepath, ext in files:
+        # Файлы расширений без паттернов (ни встроенных, ни из плагинов) в пул не отправляем
+        if not patterns_by_ext[ext]:
+            continue
+        cached = cache.get(filepath)
+        if cached and not verify_cache:
+            # Попадание по mtime и размеру проверяется одним os.stat прямо здесь:
+            # неизменённый файл не нужно передавать в пул только ради этой проверки
+            key, hit = file_cache_key(filepath, cached)
+            if hit:
+                comments = load_cached_comments(conn, filepath)
+                if comments is not None:
+                    comments_by_file[filepath] = comments
+                    if cached['lines'] is not None:
+                        file_lines[filepath] = cached['lines']
+                    continue
+                cached = None
+        tasks.append((filepath, patterns_by_ext[ext], cached, conn is not None, verify_cache, with_lines))
+    total = len(tasks)
+    pool = None
+    if total < INLINE_SCAN_LIMIT:
+        # Для нескольких файлов запуск пула (особенно процессов) дороже самого анализа
+        results = (process_file(*task) for task in tasks)
+    else:
+        pool = pool_class(max_workers=workers)
+        results = (future.result() for future in as_completed([pool.submit(process_file, *task) for task in tasks]))
+    done = 0
+    last_report = 0.0
+    try:
+        for filepath, key, comments, line_count, error in results:
+            done += 1
+            if show_progress:
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL or done == total:
+                    last_report = now
+                    sys.stdout.write(f"\r[{done}/{total}] Обработка файлов...")
+                    if done == total:
+                        sys.stdout.write('\n')
+                    sys.stdout.flush()
+            if comments is None:
+                comments = load_cached_comments(conn, filepath)
+                line_count = cache[filepath]['lines']
+                if comments is not None and all(cache[filepath].get(k) == v for k, v in key.items()):
+                    comments_by_file[filepath] = comments
+                    if line_count is not None:
+                        file_lines[filepath] = line_count
+                    continue
+                if comments is None:
+                    # Запись пропала из базы — анализируем файл заново
+                    filepath, key, comments, line_count, error = process_file(filepath, patterns_by_ext[file_exts[filepath]], None, True, verify_cache, with_lines)
+                # Иначе содержимое то же, но изменилось время модификации — ниже обновим ключ
+            if line_count is not None:
+                file_lines[filepath] = line_count
+            if error:
+                errors.append(error)
+            elif key:
+                changed[filepath] = dict(key, comments=comments, lines=line_count)
+            comments_by_file[filepath] = comments
+    finally:
+        if pool:
+            pool.shutdown()
+    if conn:
+        if changed:
+            save_cache(conn, changed)
+        conn.close()
+    all_comments = [c for filepath in sorted(comments_by_file) for c in comments_by_file[filepath]]
+    return all_comments, errors, file_lines
+
+# Каталоги, в которые scan_dir не заходит (как и в скрытые, например .git), если не задан --include-hidden
+SKIP_DIRS = frozenset({'node_modules', '__pycache__'})
+
+def file_ext(name):
+    """
+    Возвращает расширение имени файла в нижнем регистре ('.py') или '' — как os.path.splitext, но без лишних строк.
+    """
+    head, dot, ext = name.rpartition('.')
+    if not dot or not head.strip('.'):
+        return ''
+    return '.' + ext.lower()
+
+def scan_dir(root, extensions, ignore_words=None, ignore_regex=None, show_progress=True, workers=4, use_cache=True, cache_path='.comments_cache.db', max_depth=None, plugin_patterns=None, executor=None, verify_cache=False, ignore_dirs=None, with_lines=False, include_hidden=False):
+    """
+    Сканирует директорию root и все поддиректории до max_depth (скрытые каталоги, SKIP_DIRS
+    и каталоги из ignore_dirs пропускаются целиком — обход в них не заходит).
+    include_hidden=True — обходить и скрытые каталоги, и SKIP_DIRS; ignore_dirs пропускаются всё равно.
+    ignore_regex — строка или уже скомпилированное выражение (re.compile вернёт его как есть).
+    Возвращает кортеж: (все_комментарии, все_файлы, ошибки_чтения, число_строк) — см. scan_files.
+    """
+    ignore_words = [word.lower() for word in ignore_words or []]
+    ignore_re = re.compile(ignore_regex) if ignore_regex else None
+    extensions = frozenset(ext.lower() for ext in extensions)
+    skip_dirs = frozenset(ignore_dirs or []) if include_hidden else SKIP_DIRS.union(ignore_dirs or [])
+    to_scan = []
     script_path = os.path.abspath(__file__)
-    for dirpath, _, filenames in os.walk(root):
-        if max_depth is not None:
-            cur_depth = dirpath.rstrip(os.sep).count(os.sep) - root_depth
-            if cur_depth >= max_depth:
-                del filenames[:]
+    script_name = os.path.basename(script_path)
+    # Обход в глубину через os.scandir: DirEntry уже знает, файл это или каталог
+    # Глубина 0 — сам root; каталоги глубже max_depth - 1 в стек даже не попадают
+    stack = [(root, 0)] if max_depth is None or max_depth > 0 else []
+    while stack:
+        dirpath, depth = stack.pop()
+        descend = max_depth is None or depth + 1 < max_depth
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            try:
+                # follow_symlinks=False: тип берётся из d_type, без лишнего stat
+                if entry.is_dir(follow_symlinks=False):
+                    if descend and name not in skip_dirs and (include_hidden or not name.startswith('.')):
+                        subdirs.append((entry.path, depth + 1))
+                    continue
+                # Как и os.walk, символические ссылки на каталоги не обходим и файлами не считаем
+                if entry.is_symlink() and entry.is_dir():
+                    continue
+            except OSError:
+                pass
+            ext = file_ext(name)
+            if ext not in extensions:
                 continue
-        for fname in filenames:
-            ext = os.path.splitext(fname)[1].lower()
-            fpath = os.path.join(dirpath, fname)
-            if any(word.lower() in fname.lower() for word in ignore_words):
+            lower_name = name.lower()
+            if any(word in lower_name for word in ignore_words):
                 continue
-            if ignore_re and ignore_re.search(fname):
+            if ignore_re and ignore_re.search(name):
                 continue
-            if ext in extensions and os.path.abspath(fpath) != script_path:
-                all_files.append(fpath)
-    total = len(all_files)
-    all_comments = []
-    cache = load_cache(cache_path) if use_cache else {}
-    cache_changed = False
-    def process_file(idx_file):
-        idx, filepath = idx_file
-        if show_progress:
-            print(f"[{idx}/{total}] Обработка файла: {filepath}")
-        patterns = get_patterns_for_ext(os.path.splitext(filepath)[1].lower(), plugin_patterns=plugin_patterns)
-        if patterns:
-            h = file_hash(filepath)
-            if use_cache and h and filepath in cache and cache[filepath].get('hash') == h:
-                return cache[filepath]['comments']
-            try:
-                comments = find_comments_in_file(filepath, patterns)
-                if use_cache and h:
-                    cache[filepath] = {'hash': h, 'comments': comments}
-                    nonlocal cache_changed
-                    cache_changed = True
-                return comments
-            except Exception as e:
-                errors.append(f"{filepath}: {e}")
-        return []
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = [executor.submit(process_file, (idx, filepath)) for idx, filepath in enumerate(all_files, 1)]
-        for future in as_completed(futures):
-            comments = future.result()
-            all_comments.extend(comments)
-    if use_cache and cache_changed:
-        save_cache(cache_path, cache)
-    return all_comments, all_files, errors
+            if name == script_name and os.path.abspath(entry.path) == script_path:
+                continue
+            to_scan.append((entry.path, ext))
+        stack.extend(reversed(subdirs))
+    all_comments, errors, file_lines = scan_files(
+        to_scan,
+        plugin_patterns=plugin_patterns,
+        workers=workers,
+        executor=executor,
+        use_cache=use_cache,
+        cache_path=cache_path,
+        show_progress=show_progress,
+        verify_cache=verify_cache,
+        with_lines=with_lines,
+    )
+    all_files = [filepath for filepath, _ in to_scan]
+    return all_comments, all_files, errors, file_lines
 
 def clean_comment_line(line, include_symbols=False):
     """
@@ -536,73 +1018,134 @@ def clean_comment_line(line, include_symbols=False):
     """
     if include_symbols:
         return line.strip()
-    # Удаляет символы комментариев и XML-теги
-    line = re.sub(r'^\s*(///+|//+|#+|/\*+|\*+/)', '', line)
-    line = re.sub(r'<\/?summary>', '', line, flags=re.IGNORECASE)
+    # Удаляет символы комментариев без регулярок: то же, что re.sub(r'^\s*(///+|//+|#+|/\*+|\*+/)', '', line)
+    line = line.lstrip()
+    first = line[:1]
+    if first == '/':
+        if line.startswith('//'):
+            line = line.lstrip('/')
+        elif line.startswith('/*'):
+            line = line[1:].lstrip('*')
+    elif first == '#':
+        line = line.lstrip('#')
+    elif first == '*':
+        rest = line.lstrip('*')
+        if rest.startswith('/'):
+            line = rest[1:]
+    # XML-теги <summary> ищем регуляркой, только если в строке вообще есть '<'
+    if '<' in line:
+        line = SUMMARY_TAG_RE.sub('', line)
     return line.strip()
 
 def group_comments(comments, include_symbols=False):
     """
     Группирует подряд идущие /// (C#) в блоки, остальные комментарии — по одному.
+    Комментарии сортируются по (файл, строка), после чего проходятся за один линейный проход.
+    Список из scan_files уже упорядочен, поэтому сортировка только проверяет порядок за O(N).
     Возвращает список блоков с полями: файл, диапазон строк, строки блока, тип.
     """
+    comments = sorted(comments, key=lambda c: (c.file, c.line))
     grouped = []
     i = 0
     n = len(comments)
-    used = set()
     while i < n:
         c = comments[i]
-        key = (c['file'], c['line'])
-        if key in used:
-            i += 1
-            continue
-        if c['file'].endswith('.cs') and c['text'].startswith('///'):
-            start = i
-            end = i
+        if c.file.endswith('.cs') and c.text.startswith('///'):
             block_lines = []
-            txt = clean_comment_line(c['text'], include_symbols)
+            line = c.line
+            txt = clean_comment_line(c.text, include_symbols)
             if txt:
                 block_lines.append(txt)
-            used.add((c['file'], c['line']))
-            while (
-                end + 1 < n and
-                comments[end + 1]['file'] == c['file'] and
-                comments[end + 1]['line'] == comments[end]['line'] + 1 and
-                comments[end + 1]['text'].startswith('///')
-            ):
-                end += 1
-                txt = clean_comment_line(comments[end]['text'], include_symbols)
+            i += 1
+            while True:
+                # Остальные записи той же строки — дубликаты (строку /// находят и паттерн //, и ///)
+                while i < n and comments[i].file == c.file and comments[i].line == line:
+                    i += 1
+                if not (
+                    i < n and
+                    comments[i].file == c.file and
+                    comments[i].line == line + 1 and
+                    comments[i].text.startswith('///')
+                ):
+                    break
+                line += 1
+                txt = clean_comment_line(comments[i].text, include_symbols)
                 if txt:
                     block_lines.append(txt)
-                used.add((comments[end]['file'], comments[end]['line']))
+                i += 1
             if block_lines:
                 grouped.append({
-                    'file': c['file'],
-                    'start_line': c['line'],
-                    'end_line': comments[end]['line'],
+                    'file': c.file,
+                    'start_line': c.line,
+                    'end_line': line,
                     'lines': block_lines,
                     'type': 'triple_slash',
                 })
-            i = end + 1
         else:
-            txt = clean_comment_line(c['text'], include_symbols)
+            txt = clean_comment_line(c.text, include_symbols)
             if txt:
                 grouped.append({
-                    'file': c['file'],
-                    'start_line': c['line'],
-                    'end_line': c['end_line'],
+                    'file': c.file,
+                    'start_line': c.line,
+                    'end_line': c.end_line,
                     'lines': [txt],
-                    'type': 'single' if c['line'] == c['end_line'] else 'multi',
+                    'type': 'single' if c.line == c.end_line else 'multi',
                 })
             i += 1
     return grouped
 
+def block_text(block):
+    """
+    Возвращает текст блока комментариев одной строкой (строки блока через '\n').
+    Блок не изменяется: кому текст нужен несколько раз (фильтры --contains и --fail-on в main),
+    тот хранит его у себя, а словари блоков уходят в JSON как есть.
+    """
+    lines = block['lines']
+    return lines[0] if len(lines) == 1 else '\n'.join(lines)
+
+def any_pattern_search(patterns, flags=re.IGNORECASE):
+    """
+    Возвращает функцию text -> bool: встречается ли в тексте хотя бы одно из регулярных выражений patterns.
+    Выражения без групп объединяются в одну альтернативу, чтобы текст просматривался за один вызов search.
+    Если объединить нельзя (группы и обратные ссылки, флаги внутри выражения), выражения проверяются по очереди.
+    Если все выражения — простые ASCII-слова (--contains TODO FIXME HACK) и установлен pyahocorasick,
+    слова ищутся автоматом Ахо-Корасик за один проход по тексту в нижнем регистре. Текст с не-ASCII
+    символами проверяется регуляркой — у IGNORECASE и str.lower() для них разные правила.
+    """
+    compiled = [re.compile(pat, flags) for pat in patterns]
+    plain_words = len(patterns) > 1 and flags == re.IGNORECASE and all(
+        pat and pat.isascii() and re.escape(pat) == pat for pat in patterns
+    )
+    # pyahocorasick загружается только здесь — когда слов несколько и автомат действительно нужен
+    ahocorasick = optional_module('ahocorasick') if plain_words else None
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for pat in patterns:
+            automaton.add_word(pat.lower(), pat)
+        automaton.make_automaton()
+        combined = re.compile('|'.join(patterns), flags)
+        def search(text):
+            if text.isascii():
+                return next(automaton.iter(text.lower()), None) is not None
+            return combined.search(text) is not None
+        return search
+    if len(compiled) > 1 and not any(r.groups for r in compiled):
+        try:
+            combined = re.compile('|'.join(f'(?:{pat})' for pat in patterns), flags)
+        except re.error:
+            pass
+        else:
+            return lambda text: combined.search(text) is not None
+    return lambda text: any(r.search(text) for r in compiled)
+
 def print_comments_from_grouped(grouped, show_content=False, highlight_words=None):
     """
     Красиво печатает сгруппированные комментарии в консоль (цветной вывод).
     Если show_content=True — выводит только текст комментариев.
     highlight_words — список ключевых слов для подсветки (регистронезависимо).
     """
+    # colorama нужен только для цветного вывода — импортируем его здесь, а не при загрузке модуля
+    from colorama import init, Fore, Style as ColoramaStyle
     init(autoreset=True)
     BLUE = Fore.BLUE + ColoramaStyle.BRIGHT
     YELLOW = Fore.YELLOW + ColoramaStyle.BRIGHT
@@ -613,12 +1156,15 @@ def print_comments_from_grouped(grouped, show_content=False, highlight_words=Non
     RESET = ColoramaStyle.RESET_ALL
     if highlight_words is None:
         highlight_words = ['TODO', 'FIXME', 'BUG', 'HACK', 'NOTE', 'WARNING']
-    highlight_res = [re.compile(rf'(?i)\\b{re.escape(word)}\\b') for word in highlight_words]
+    palette = [RED, MAGENTA, CYAN, YELLOW, GREEN, BLUE]
+    # Одна регулярка на все слова: по номеру сработавшей группы выбирается цвет слова
+    highlight_re = re.compile(
+        r'(?i)\b(?:' + '|'.join(f'({re.escape(word)})' for word in highlight_words) + r')\b'
+    ) if highlight_words else None
     def highlight_text(text):
-        for i, regex in enumerate(highlight_res):
-            color = [RED, MAGENTA, CYAN, YELLOW, GREEN, BLUE][i % 6]
-            text = regex.sub(lambda m: color + m.group(0) + RESET, text)
-        return text
+        if not highlight_re:
+            return text
+        return highlight_re.sub(lambda m: palette[(m.lastindex - 1) % 6] + m.group(0) + RESET, text)
     for block in grouped:
         lines = [highlight_text(line) for line in block['lines']]
         if show_content:
@@ -632,30 +1178,31 @@ def print_comments_from_grouped(grouped, show_content=False, highlight_words=Non
         print()  # Пустая строка между блоками
 
 def save_csv(comments, filename):
+    import csv
     with open(filename, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
         writer.writerow(['file', 'line', 'end_line', 'text'])
         for c in comments:
-            writer.writerow([c['file'], c['line'], c['end_line'], c['text']])
+            writer.writerow([c.file, c.line, c.end_line, c.text])
 
 def save_json(comments, filename):
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(comments, f, ensure_ascii=False, indent=2)
+    write_json(comments, filename)
 
 def save_txt(comments, filename):
     with open(filename, 'w', encoding='utf-8') as f:
         for c in comments:
-            if c['line'] == c['end_line']:
-                f.write(f"{c['file']}:{c['line']}: {c['text']}\n")
+            if c.line == c.end_line:
+                f.write(f"{c.file}:{c.line}: {c.text}\n")
             else:
-                f.write(f"{c['file']}:{c['line']}-{c['end_line']}: {c['text']}\n")
+                f.write(f"{c.file}:{c.line}-{c.end_line}: {c.text}\n")
 
 def save_html(comments, filename):
+    from html import escape
     with open(filename, 'w', encoding='utf-8') as f:
         f.write('<html><head><meta charset="utf-8"><title>Comments</title></head><body>')
         f.write('<table border="1"><tr><th>File</th><th>Line</th><th>End Line</th><th>Text</th></tr>')
         for c in comments:
-            f.write(f'<tr><td>{escape(c["file"])}</td><td>{c["line"]}</td><td>{c["end_line"]}</td><td><pre>{escape(c["text"])}</pre></td></tr>')
+            f.write(f'<tr><td>{escape(c.file)}</td><td>{c.line}</td><td>{c.end_line}</td><td><pre>{escape(c.text)}</pre></td></tr>')
         f.write('</table></body></html>')
 
 def save_pretty_txt(comments, filename):
@@ -666,7 +1213,7 @@ def save_pretty_txt(comments, filename):
                 f.write(f"{block['file']}:{block['start_line']}: {block['lines'][0]}\n")
             else:
                 f.write(f"{block['file']}:{block['start_line']}-{block['end_line']}:\n")
-                f.write('\n'.join(block['lines']) + '\n')
+                f.write(block_text(block) + '\n')
 
 def get_parser(lang):
     """
@@ -691,6 +1238,8 @@ def get_parser(lang):
     ], help=L['help_ext'])
     config_group.add_argument('--ignore', nargs='*', default=[], help=L['help_ignore'])
     config_group.add_argument('--ignore-regex', default=None, help=L['help_ignore_regex'])
+    config_group.add_argument('--ignore-dir', nargs='*', default=[], help=L['help_ignore_dir'])
+    config_group.add_argument('--include-hidden', action='store_true', help=L['help_include_hidden'])
     config_group.add_argument('--format', choices=['csv', 'json', 'html', 'txt', 'prettytxt'], help=L['help_format'])
     config_group.add_argument('--out', help=L['help_out'])
     config_group.add_argument('--lang', default=lang, choices=['en', 'ru'], help=L['help_lang'])
@@ -703,6 +1252,8 @@ def get_parser(lang):
     parser.add_argument('--show-progress', dest='show_progress', action='store_true', help=L['help_show_progress'])
     parser.add_argument('--no-progress', dest='show_progress', action='store_false', help=L['help_no_progress'])
     parser.add_argument('--workers', type=int, default=4, help=L['help_workers'])
+    parser.add_argument('--executor', choices=['thread', 'process'], default=None, help=L['help_executor'])
+    parser.add_argument('--cache-verify', action='store_true', help=L['help_cache_verify'])
     parser.add_argument('--contains', nargs='*', default=[], help=L['help_contains'])
     parser.add_argument('--fail-on', nargs='*', default=[], help=L['help_fail_on'])
     parser.add_argument('--show-content', action='store_true', help=L['help_show_content'])
@@ -710,7 +1261,7 @@ def get_parser(lang):
     parser.add_argument('--files', nargs='+', help=L['help_files'])
     parser.add_argument('--filelist', help=L['help_filelist'])
     parser.add_argument('--highlight', nargs='*', default=['TODO', 'FIXME', 'BUG', 'HACK', 'NOTE', 'WARNING'], help=L['help_highlight'])
-    parser.add_argument('--max-depth', type=int, default=None, help=L['help_max_depth'])
+    parser.add_argument('--max-depth', type=int, default=1, help=L['help_max_depth'])
     parser.add_argument('--plugin', nargs='*', default=[], help=L['help_plugin'])
     parser.add_argument('--report', choices=['md', 'csv', 'txt', 'html', 'xlsx', 'pdf', 'json'], help=L['help_report'])
     parser.add_argument('--report-out', help=L['help_report_out'])
@@ -744,9 +1295,9 @@ def print_supported_languages():
         ex = []
         for p in patterns:
             if p['type'] == 'single':
-                ex.append(p.get('pattern', ''))
+                ex.append(p['pattern'].pattern)
             elif p['type'] == 'multi':
-                ex.append(f"{p.get('start','')} ... {p.get('end','')}")
+                ex.append(f"{p['start'].pattern} ... {p['end'].pattern}")
         print(f"  {ext:6}  {lang:16}  Типы: {', '.join(type_strs)}  Примеры: {', '.join(ex)}")
 
 def main():
@@ -795,6 +1346,10 @@ def main():
     parser0.add_argument('--lang', default=None, choices=['en', 'ru'])
     parser0.add_argument('--support-lang', action='store_true')
     args0, _ = parser0.parse_known_args()
+    # Для --support-lang полный парсер не нужен: хватает двух аргументов parser0
+    if args0.support_lang:
+        print_supported_languages()
+        sys.exit(0)
     
     # Если --lang не задан, определяем по локали
     if args0.lang is None:
@@ -803,17 +1358,20 @@ def main():
     else:
         lang = args0.lang
     parser = get_parser(lang)
-    
-    # Найдём аргумент --max-depth и установим значение по умолчанию 1
-    for action in parser._actions:
-        if action.dest == 'max_depth':
-            action.default = 1
     args = parser.parse_args()
-    if getattr(args, 'support_lang', False):
-        print_supported_languages()
-        sys.exit(0)
+    # --ignore-regex компилируется один раз здесь и дальше передаётся готовым объектом;
+    # ошибка в выражении выводится как ошибка аргумента, а не трассировкой из обхода каталогов
+    if args.ignore_regex:
+        try:
+            args.ignore_regex = re.compile(args.ignore_regex)
+        except re.error as e:
+            parser.error(f"--ignore-regex: {e}")
+    # Эти модули нужны только для самого анализа — после ранних выходов
+    import glob
+    import shutil
+    import subprocess
     use_cache = True
-    cache_path = '.comments_cache.json'
+    cache_path = '.comments_cache.db'
     plugin_patterns = {}  # <-- всегда определяем
     if getattr(args, 'plugin', None):
         plugin_patterns = load_plugins(args.plugin)
@@ -836,19 +1394,19 @@ def main():
             sys.exit(1)
 
     expanded_files = []
+    # То же, что os.path.abspath, но без вызова getcwd для каждого файла
+    cwd = os.getcwd()
     for path in files_from_args:
         # Поддержка wildcard и относительных путей
         if '*' in path or '?' in path or ('[' in path and ']' in path):
             expanded = glob.glob(path, recursive=True)
-            expanded_files.extend([os.path.abspath(f) for f in expanded])
+            expanded_files.extend([os.path.normpath(os.path.join(cwd, f)) for f in expanded])
         else:
-            expanded_files.append(os.path.abspath(path))
+            expanded_files.append(os.path.normpath(os.path.join(cwd, path)))
 
     if expanded_files:
         # --- Кэширование ---
         use_cache = True
-        cache = load_cache(cache_path) if use_cache else {}
-        cache_changed = False
         # --- Плагины ---
         if getattr(args, 'plugin', None):
             plugin_patterns = load_plugins(args.plugin)
@@ -856,39 +1414,28 @@ def main():
             plugin_patterns = {}
         # Фильтруем по расширениям, если указаны --ext
         # Не сканировать сам скрипт 
-        script_path = os.path.abspath(__file__)
-        files_to_scan = [f for f in expanded_files if os.path.splitext(f)[1].lower() in set(args.ext) and os.path.abspath(f) != script_path]
-        all_files = files_to_scan
-        errors = []
-        all_comments = []
-        def process_file(filepath):
-            patterns = get_patterns_for_ext(os.path.splitext(filepath)[1].lower(), plugin_patterns=plugin_patterns)
-            if patterns:
-                h = file_hash(filepath)
-                if use_cache and h and filepath in cache and cache[filepath].get('hash') == h:
-                    return cache[filepath]['comments']
-                try:
-                    comments = find_comments_in_file(filepath, patterns)
-                    if use_cache and h:
-                        cache[filepath] = {'hash': h, 'comments': comments}
-                        nonlocal cache_changed
-                        cache_changed = True
-                    return comments
-                except Exception as e:
-                    errors.append(f"{filepath}: {e}")
-            return []
-        with ThreadPoolExecutor(max_workers=args.workers) as executor:
-            futures = [executor.submit(process_file, filepath) for filepath in all_files]
-            for future in as_completed(futures):
-                comments = future.result()
-                all_comments.extend(comments)
-        comments = all_comments
-        files = all_files
-        if use_cache and cache_changed:
-            save_cache(cache_path, cache)
+        script_path = os.path.normcase(os.path.abspath(__file__))
+        ext_set = {ext.lower() for ext in args.ext}
+        files_to_scan = []
+        # Пути уже абсолютные; dict.fromkeys убирает повторы от пересекающихся масок, сохраняя порядок
+        for f in dict.fromkeys(expanded_files):
+            ext = file_ext(os.path.basename(f))
+            if ext in ext_set and os.path.normcase(f) != script_path:
+                files_to_scan.append((f, ext))
+        files = [f for f, _ in files_to_scan]
+        comments, errors, file_lines = scan_files(
+            files_to_scan,
+            plugin_patterns=plugin_patterns,
+            workers=args.workers,
+            executor=args.executor,
+            use_cache=use_cache,
+            cache_path=cache_path,
+            verify_cache=args.cache_verify,
+            with_lines=bool(args.report),
+        )
     else:
         # Обычный режим через scan_dir
-        comments, files, errors = scan_dir(
+        comments, files, errors, file_lines = scan_dir(
             args.root,
             set(args.ext),
             ignore_words=args.ignore,
@@ -897,30 +1444,32 @@ def main():
             workers=args.workers,
             use_cache=use_cache,
             cache_path=cache_path,
-            max_depth=args.max_depth if args.max_depth is not None else 1,
-            plugin_patterns=plugin_patterns
+            max_depth=args.max_depth,
+            plugin_patterns=plugin_patterns,
+            executor=args.executor,
+            verify_cache=args.cache_verify,
+            ignore_dirs=args.ignore_dir,
+            with_lines=bool(args.report),
+            include_hidden=args.include_hidden,
         )
 
     try:
-        comments.sort(key=lambda c: (c['file'], c['line']))
         grouped = group_comments(comments, include_symbols=args.include_symbols)
         if args.only:
             grouped = [g for g in grouped if g['type'] in args.only]
         if args.min_lines > 0:
             grouped = [g for g in grouped if len(g['lines']) >= args.min_lines]
-        if args.contains:
-            contains_res = [re.compile(pat, re.IGNORECASE) for pat in args.contains]
-            def block_matches(block):
-                text = '\n'.join(block['lines'])
-                return any(r.search(text) for r in contains_res)
-            grouped = [g for g in grouped if block_matches(g)]
+        if args.contains or args.fail_on:
+            # Текст блока склеиваем один раз — он нужен обоим фильтрам
+            blocks = [(g, block_text(g)) for g in grouped]
+            if args.contains:
+                matches = any_pattern_search(args.contains)
+                blocks = [(g, text) for g, text in blocks if matches(text)]
+                grouped = [g for g, _ in blocks]
         exit_code = 0
         if args.fail_on:
-            fail_res = [re.compile(pat, re.IGNORECASE) for pat in args.fail_on]
-            def block_fails(block):
-                text = '\n'.join(block['lines'])
-                return any(r.search(text) for r in fail_res)
-            failed = [g for g in grouped if block_fails(g)]
+            fails = any_pattern_search(args.fail_on)
+            failed = [g for g, text in blocks if fails(text)]
             if failed:
                 print(f"\n{L['ci_fail'].format(n=len(failed))}")
                 exit_code = 1
@@ -945,9 +1494,9 @@ def main():
             # Явно выводим путь сохранения
             print((f"Результат сохранён в: {args.out}" if args.lang == 'ru' else f"Output saved to: {args.out}"))
         if args.report:
-            generate_report(grouped, files, report_type=args.report, filename=args.report_out)
+            generate_report(grouped, files, report_type=args.report, filename=args.report_out, file_lines=file_lines)
             if not args.report_out:
-                print(generate_report(grouped, files, report_type=args.report))
+                print(generate_report(grouped, files, report_type=args.report, file_lines=file_lines))
         if getattr(args, 'interactive', False):
             interactive_viewer(grouped)
         # --- --edit: открыть строку файла в Notepad++ или Notepad ---
@@ -1004,6 +1553,7 @@ def write_header(f, root, files, grouped, warnings, errors):
     - сколько предупреждений
     - ошибки (если были)
     """
+    import datetime
     f.write(f"Directory: {os.path.abspath(root)}\n")
     f.write(f"Datetime: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     f.write(f"Files checked: {len(files)}\n")
@@ -1019,59 +1569,71 @@ def save_pretty_txt_from_grouped(grouped, filename, root, files, warnings, error
     """
     Сохраняет prettytxt-отчёт с шапкой (директория, дата, статистика, ошибки) и блоками комментариев.
     """
-    with open(filename, 'w', encoding='utf-8') as f:
+    # Строки собираются в список и пишутся одним writelines — без пары вызовов write на каждый блок
+    out = []
+    append = out.append
+    for block in grouped:
+        if block['start_line'] == block['end_line']:
+            append(f"{block['file']}:{block['start_line']}: {block['lines'][0]}\n")
+        else:
+            append(f"{block['file']}:{block['start_line']}-{block['end_line']}:\n{block_text(block)}\n")
+    with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
         write_header(f, root, files, grouped, warnings, errors)
-        for block in grouped:
-            if block['start_line'] == block['end_line']:
-                f.write(f"{block['file']}:{block['start_line']}: {block['lines'][0]}\n")
-            else:
-                f.write(f"{block['file']}:{block['start_line']}-{block['end_line']}:\n")
-                f.write('\n'.join(block['lines']) + '\n')
+        f.writelines(out)
 
 def save_csv_from_grouped(grouped, filename):
     """
     Сохраняет результат в CSV-файл (разделители — запятые, кодировка UTF-8).
     """
+    import csv
     with open(filename, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
         writer.writerow(['file', 'start_line', 'end_line', 'type', 'text'])
         for block in grouped:
-            writer.writerow([block['file'], block['start_line'], block['end_line'], block['type'], '\n'.join(block['lines'])])
+            writer.writerow([block['file'], block['start_line'], block['end_line'], block['type'], block_text(block)])
 
 def save_json_from_grouped(grouped, filename):
     """
     Сохраняет результат в JSON-файл (удобно для последующей обработки).
     """
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(grouped, f, ensure_ascii=False, indent=2)
+    write_json(grouped, filename)
 
 def save_html_from_grouped(grouped, filename):
     """
     Сохраняет результат в HTML-файл (можно открыть в браузере).
     """
+    from html import escape
+    # У одного файла обычно много блоков — путь экранируем один раз на файл
+    escaped_files = {}
     with open(filename, 'w', encoding='utf-8') as f:
         f.write('<html><head><meta charset="utf-8"><title>Comments</title></head><body>')
         f.write('<table border="1"><tr><th>File</th><th>Start Line</th><th>End Line</th><th>Type</th><th>Text</th></tr>')
         for block in grouped:
-            f.write(f'<tr><td>{escape(block["file"])}</td><td>{block["start_line"]}</td><td>{block["end_line"]}</td><td>{block["type"]}</td><td><pre>{escape("\n".join(block["lines"]))}</pre></td></tr>')
+            path = escaped_files.get(block['file'])
+            if path is None:
+                path = escaped_files[block['file']] = escape(block['file'])
+            f.write(f'<tr><td>{path}</td><td>{block["start_line"]}</td><td>{block["end_line"]}</td><td>{block["type"]}</td><td><pre>{escape(block_text(block))}</pre></td></tr>')
         f.write('</table></body></html>')
 
 def save_txt_from_grouped(grouped, filename):
     """
     Сохраняет результат в обычный TXT-файл (без шапки, только блоки).
     """
-    with open(filename, 'w', encoding='utf-8') as f:
-        for block in grouped:
-            if block['start_line'] == block['end_line']:
-                f.write(f"{block['file']}:{block['start_line']}: {block['lines'][0]}\n")
-            else:
-                f.write(f"{block['file']}:{block['start_line']}-{block['end_line']}: {block['lines'][0]}\n")
+    out = [
+        f"{block['file']}:{block['start_line']}: {block['lines'][0]}\n"
+        if block['start_line'] == block['end_line'] else
+        f"{block['file']}:{block['start_line']}-{block['end_line']}: {block['lines'][0]}\n"
+        for block in grouped
+    ]
+    with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.writelines(out)
 
 def load_plugins(plugin_paths):
     """
     Загружает плагины из списка путей. Каждый плагин должен экспортировать функцию get_patterns().
     Возвращает список паттернов для расширений.
     """
+    import importlib.util
     plugin_patterns = {}
     for path in plugin_paths:
         try:
@@ -1084,15 +1646,17 @@ def load_plugins(plugin_paths):
                     for ext, pats in patterns.items():
                         if ext not in plugin_patterns:
                             plugin_patterns[ext] = []
-                        plugin_patterns[ext].extend(pats)
+                        plugin_patterns[ext].extend(compile_pattern(p) for p in pats)
         except Exception as e:
             print(f"[PLUGIN ERROR] {path}: {e}")
     return plugin_patterns
 
-def generate_report(grouped, files, report_type='md', filename=None):
+def generate_report(grouped, files, report_type='md', filename=None, file_lines=None):
     """
     Генерирует аналитический отчёт по комментариям: статистика, топ-файлы, распределение по типам.
     report_type: 'md', 'csv', 'txt', 'html', 'xlsx', 'pdf', 'json'.
+    file_lines — число строк файлов, посчитанное при сканировании ({путь: строк}); заново читаются
+    только файлы, которых в нём нет.
     Если filename задан — сохраняет, иначе возвращает строку (кроме xlsx/pdf).
     """
 
@@ -1101,11 +1665,16 @@ def generate_report(grouped, files, report_type='md', filename=None):
     type_counter = Counter()
     file_counter = Counter()
     total_lines = 0
+    known_lines = file_lines or {}
     file_lines = defaultdict(int)
     for block in grouped:
         type_counter[block['type']] += 1
         file_counter[block['file']] += 1
     for f in files:
+        if f in known_lines:
+            file_lines[f] = known_lines[f]
+            total_lines += known_lines[f]
+            continue
         try:
             with open(f, encoding='utf-8', errors='ignore') as ff:
                 lines = ff.readlines()
@@ -1116,7 +1685,9 @@ def generate_report(grouped, files, report_type='md', filename=None):
     comments_total = sum(type_counter.values())
     comments_per_kloc = (comments_total / total_lines * 1000) if total_lines else 0
     
-    # Формируем отчёт
+    # Формируем отчёт. Текстовые отчёты (md, html, txt) собираются списком строк и в файл пишутся
+    # потоком, без промежуточной склеенной строки; целиком она собирается, только если отчёт возвращается
+    report = None
     if report_type == 'md':
         lines = [
             '# Аналитика по комментариям',
@@ -1137,7 +1708,6 @@ def generate_report(grouped, files, report_type='md', filename=None):
         lines.append('## Распределение по файлам:')
         for f in sorted(file_counter, key=lambda x: -file_counter[x]):
             lines.append(f'- `{f}`: {file_counter[f]} / {file_lines.get(f, "?")} строк')
-        report = '\n'.join(lines)
     elif report_type == 'csv':
         import csv
         import io
@@ -1160,15 +1730,16 @@ def generate_report(grouped, files, report_type='md', filename=None):
             lines.append(f'<li><b>{escape(str(t))}</b>: {n}</li>')
         lines.append('</ul>')
         lines.append('<h2>Топ-10 файлов по количеству комментариев</h2><ul>')
+        # Пути выводятся и в топе, и в таблице — экранируем каждый один раз
+        escaped_files = {f: escape(f) for f in file_counter}
         for f, n in file_counter.most_common(10):
-            lines.append(f'<li><code>{escape(f)}</code>: {n} (всего строк: {file_lines.get(f, "?")})</li>')
+            lines.append(f'<li><code>{escaped_files[f]}</code>: {n} (всего строк: {file_lines.get(f, "?")})</li>')
         lines.append('</ul>')
         lines.append('<h2>Распределение по файлам</h2>')
         lines.append('<table border="1"><tr><th>Файл</th><th>Комментариев</th><th>Строк</th></tr>')
         for f in sorted(file_counter, key=lambda x: -file_counter[x]):
-            lines.append(f'<tr><td><code>{escape(f)}</code></td><td>{file_counter[f]}</td><td>{file_lines.get(f, "?")}</td></tr>')
+            lines.append(f'<tr><td><code>{escaped_files[f]}</code></td><td>{file_counter[f]}</td><td>{file_lines.get(f, "?")}</td></tr>')
         lines.append('</table></body></html>')
-        report = '\n'.join(lines)
     elif report_type == 'xlsx':
         try:
             import openpyxl
@@ -1193,7 +1764,7 @@ def generate_report(grouped, files, report_type='md', filename=None):
             print('Для экспорта в xlsx установите пакет openpyxl')
             return
     elif report_type == 'json':
-        report = _json.dumps({
+        report = dump_json({
             'summary': {
                 'files': len(files),
                 'blocks': comments_total,
@@ -1203,7 +1774,7 @@ def generate_report(grouped, files, report_type='md', filename=None):
             'top_files': file_counter.most_common(10),
             'files': {f: {'comments': file_counter[f], 'lines': file_lines.get(f, '?')} for f in file_counter},
             'blocks': grouped,
-        }, ensure_ascii=False, indent=2)
+        }, indent=True)
         if filename:
             with open(filename, 'w', encoding='utf-8') as f:
                 f.write(report)
@@ -1299,56 +1870,180 @@ def generate_report(grouped, files, report_type='md', filename=None):
         lines.append('Распределение по файлам:')
         for f in sorted(file_counter, key=lambda x: -file_counter[x]):
             lines.append(f'- {f}: {file_counter[f]} / {file_lines.get(f, "?")} строк')
-        report = '\n'.join(lines)
     if filename and report_type not in ('xlsx', 'pdf'):
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(report)
+        with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            if report is None:
+                from itertools import islice
+                f.write(lines[0])
+                f.writelines('\n' + line for line in islice(lines, 1, None))
+            else:
+                f.write(report)
     elif filename and report_type in ('xlsx', 'pdf'):
         pass
     else:
-        return report
+        return report if report is not None else '\n'.join(lines)
+
+# Язык подсветки rich по расширению файла (без точки); для остальных используется само расширение
+PREVIEW_LANGUAGES = {
+    'py': 'python', 'js': 'javascript', 'ts': 'typescript', 'cs': 'csharp', 'cpp': 'cpp', 'c': 'c',
+    'h': 'c', 'java': 'java', 'xml': 'xml', 'html': 'html', 'css': 'css', 'sh': 'bash', 'rb': 'ruby',
+    'php': 'php', 'go': 'go', 'rs': 'rust', 'swift': 'swift', 'kt': 'kotlin', 'json': 'json',
+}
+
+# Очистка экрана для простого режима просмотра: ANSI-последовательность вместо запуска cls/clear
+CLEAR_SCREEN = '\x1b[2J\x1b[H'
+
+# Прочитанные для предпросмотра начала файлов: {путь: (время изменения, строки, файл прочитан целиком)}
+PREVIEW_CACHE = {}
+PREVIEW_CACHE_SIZE = 64
+# Сколько строк файла читается для предпросмотра как минимум
+PREVIEW_MIN_LINES = 256
+
+def read_file_lines(path, mtime_ns, count):
+    """
+    Возвращает первые count строк файла (или все, если их меньше) для предпросмотра.
+    Файл читается потоково только до нужной строки, с запасом вдвое; прочитанное начало кэшируется
+    по (путь, время изменения): при листании комментариев одного файла сверху вниз он читается
+    несколько раз лишь для самых дальних строк, а изменённый файл перечитывается.
+    """
+    from itertools import islice
+    cached = PREVIEW_CACHE.get(path)
+    if cached and cached[0] == mtime_ns and (cached[2] or len(cached[1]) >= count):
+        return cached[1]
+    limit = max(count * 2, PREVIEW_MIN_LINES)
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        lines = tuple(islice(f, limit))
+    PREVIEW_CACHE.pop(path, None)
+    if len(PREVIEW_CACHE) >= PREVIEW_CACHE_SIZE:
+        # Вытесняется файл, дольше всех не перечитывавшийся
+        del PREVIEW_CACHE[next(iter(PREVIEW_CACHE))]
+    PREVIEW_CACHE[path] = (mtime_ns, lines, len(lines) < limit)
+    return lines
+
+@lru_cache(maxsize=None)
+def find_editor():
+    """
+    Ищет редактор для перехода к строке комментария ([G]o to) — один раз за запуск, а не на каждое нажатие.
+    Порядок: Notepad++ (только Windows, из PATH или из стандартного каталога), VS Code, Sublime Text, gedit.
+    Возвращает (редактор, команда запуска) или (None, None), если ни один не найден.
+    """
+    import shutil
+    if os.name == 'nt':
+        if shutil.which('notepad++'):
+            return 'notepad++', 'notepad++'
+        npp_path = r'C:\Program Files\Notepad++\notepad++.exe'
+        if os.path.exists(npp_path):
+            return 'notepad++', npp_path
+    for editor in ('code', 'subl', 'gedit'):
+        if shutil.which(editor):
+            return editor, editor
+    return None, None
+
+def spawn(command, **kwargs):
+    """
+    Запускает внешнюю программу (редактор, xdg-open) отдельно от просмотра и не ждёт её завершения.
+    На Windows — DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP без перебора дескрипторов (close_fds=False),
+    на остальных системах — в новой сессии, чтобы редактор не получал сигналы терминала просмотра.
+    """
+    import subprocess
+    if os.name == 'nt':
+        kwargs.setdefault('creationflags', subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP)
+        kwargs.setdefault('close_fds', False)
+    else:
+        kwargs.setdefault('start_new_session', True)
+    return subprocess.Popen(command, **kwargs)
+
+def open_files(files):
+    """
+    Открывает файлы в Notepad++ (или Блокноте) на Windows, через xdg-open на остальных системах.
+    Запуски идут параллельно в пуле потоков — при массовом открытии ([A]ll open) не ждём каждый Popen по очереди.
+    Возвращает список ошибок в порядке файлов (None — файл открыт).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    def open_one(f):
+        try:
+            if os.name == 'nt':
+                npp_path = r'C:\Program Files\Notepad++\notepad++.exe'
+                if os.path.exists(npp_path):
+                    spawn([npp_path, f])
+                else:
+                    spawn(['notepad.exe', f])
+            else:
+                spawn(['xdg-open', f])
+        except Exception as e:
+            return e
+        return None
+    if len(files) < 2:
+        return [open_one(f) for f in files]
+    with ThreadPoolExecutor(max_workers=min(8, len(files))) as pool:
+        return list(pool.map(open_one, files))
 
 def preview_code_around_comment(block, context=3, use_rich=False):
     """
     Возвращает (code, start_line, language) — строки кода вокруг комментария, номер первой строки, язык (если use_rich).
     """
     try:
-        with open(block['file'], encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
+        lines = read_file_lines(block['file'], os.stat(block['file']).st_mtime_ns, block['end_line'] + context)
         start = max(0, block['start_line'] - 1 - context)
         end = min(len(lines), block['end_line'] + context)
         preview = lines[start:end]
         code = ''.join(preview)
         if use_rich:
             ext = block['file'].split('.')[-1].lower()
-            ext_map = {
-                'py': 'python', 'js': 'javascript', 'ts': 'typescript', 'cs': 'csharp', 'cpp': 'cpp', 'c': 'c',
-                'h': 'c', 'java': 'java', 'xml': 'xml', 'html': 'html', 'css': 'css', 'sh': 'bash', 'rb': 'ruby',
-                'php': 'php', 'go': 'go', 'rs': 'rust', 'swift': 'swift', 'kt': 'kotlin', 'json': 'json',
-            }
-            language = ext_map.get(ext, ext)
+            language = PREVIEW_LANGUAGES.get(ext, ext)
             return code, start + 1, language
         return code, start + 1, None
     except Exception as e:
         return (f'[Ошибка предпросмотра кода: {e}]', 1, 'text') if use_rich else (f'[Ошибка предпросмотра кода: {e}]', 1, None)
 
+def comment_block_search_strings(code_lines, comment_lines):
+    """
+    Готовит строки для поиска блока комментария в коде: (haystack, needle, число строк блока) или None,
+    если искать нечего. Строки склеиваются через '\n' без отступов: окно кода совпадает с комментарием
+    ровно тогда, когда '\n' + комментарий + '\n' встречается в '\n' + код + '\n'.
+    """
+    comment_stripped = [line for line in map(str.strip, comment_lines) if line]
+    # Строка комментария с переводом строки внутри не совпадёт ни с одной строкой кода
+    if not comment_stripped or any(len(line.splitlines()) != 1 for line in comment_stripped):
+        return None
+    haystack = '\n' + '\n'.join(map(str.strip, code_lines)) + '\n'
+    needle = '\n' + '\n'.join(comment_stripped) + '\n'
+    return haystack, needle, len(comment_stripped)
+
 def find_comment_block_in_code(code_lines, comment_lines):
     """
-    Ищет последовательность строк из comment_lines в code_lines (игнорируя отступы).
+    Ищет последовательность строк из comment_lines в code_lines (игнорируя отступы и переводы строк в конце —
+    строки можно передавать прямо из splitlines(keepends=True)).
     Возвращает список индексов строк кода, которые соответствуют блоку комментария.
+    Поиск идёт через str.find по склеенным строкам (comment_block_search_strings), а не срезами списков.
+    Номер строки совпадения — число '\n' перед ним (str.count от предыдущего совпадения), без таблицы смещений.
     """
     indices = set()
-    if not comment_lines:
+    search = comment_block_search_strings(code_lines, comment_lines)
+    if search is None:
         return indices
-    code_stripped = [line.strip() for line in code_lines]
-    comment_stripped = [line.strip() for line in comment_lines if line.strip()]
-    n = len(code_stripped)
-    m = len(comment_stripped)
-    for i in range(n - m + 1):
-        if code_stripped[i:i+m] == comment_stripped:
-            indices.update(range(i, i+m))
+    haystack, needle, m = search
+    i = prev = 0
+    pos = haystack.find(needle)
+    while pos >= 0:
+        i += haystack.count('\n', prev, pos)
+        prev = pos
+        indices.update(range(i, i + m))
+        pos = haystack.find(needle, pos + 1)
     return indices
 
+def find_first_comment_block_index(code_lines, comment_lines):
+    """
+    Как find_comment_block_in_code, но возвращает только индекс первой строки первого совпадения
+    (или None) — поиск останавливается на нём. Нужен [G]o to, которому важна лишь первая строка.
+    """
+    search = comment_block_search_strings(code_lines, comment_lines)
+    if search is None:
+        return None
+    haystack, needle, _ = search
+    pos = haystack.find(needle)
+    return haystack.count('\n', 0, pos) if pos >= 0 else None
+
 def interactive_viewer(grouped):
     """
     Современный интерактивный просмотр комментариев: 
@@ -1361,6 +2056,11 @@ def interactive_viewer(grouped):
 
     Старый режим (input) — fallback.
     """
+    # Модули для обработчиков клавиш импортируются один раз при входе в просмотр, а не на каждое нажатие
+    try:
+        import pyperclip
+    except ImportError:
+        pyperclip = None
     try:
         from prompt_toolkit.application import Application
         from prompt_toolkit.key_binding import KeyBindings
@@ -1370,19 +2070,23 @@ def interactive_viewer(grouped):
         from prompt_toolkit.widgets import Frame
         from prompt_toolkit.styles import Style
         from prompt_toolkit.formatted_text import HTML
-        import os, subprocess
-        try:
-            from rich.console import Console
-            from rich.syntax import Syntax
-            from rich.text import Text
-            rich_console = Console()
-            use_rich = True
-        except ImportError:
-            use_rich = False
+        from prompt_toolkit.shortcuts import input_dialog, message_dialog
+        from prompt_toolkit.shortcuts.dialogs import checkboxlist_dialog
+        import asyncio
+        from bisect import bisect_right
+        from itertools import accumulate
         idx = [0]
         filtered = [grouped]
+        # Отсортированный список файлов текущей выборки для [A]ll open и [E]xport; считается
+        # при первом обращении и сбрасывается, когда фильтр или поиск меняют выборку
+        filtered_files = [None]
         filter_type = [None]
         search_term = ['']
+        # Поля блоков для фильтра и поиска хранятся отдельными списками, параллельными grouped:
+        # [F]ilter и [S]earch проходят по строкам, а не по словарям блоков. Текст блока в нижнем
+        # регистре (строки через '\n') собирается при первом поиске
+        block_types = [b['type'] for b in grouped]
+        block_text_lower = [None]
         style = Style.from_dict({
             'frame': 'bg:#222222 #ffffff',
             'title': 'bold underline',
@@ -1391,7 +2095,50 @@ def interactive_viewer(grouped):
         })
         def get_current_block():
             return filtered[0][idx[0]] if filtered[0] else None
-        def render():
+        # Журнал [G]o to открывается один раз при первой записи и закрывается при выходе из просмотра
+        debug_log = [None]
+        def write_debug(message):
+            if debug_log[0] is None:
+                debug_log[0] = open('find_comments.debug', 'a', encoding='utf-8', buffering=65536)
+            debug_log[0].write(message + '\n')
+        def get_filtered_files():
+            if filtered_files[0] is None:
+                filtered_files[0] = sorted({b['file'] for b in filtered[0]})
+            return filtered_files[0]
+        # Отрисованные комментарий и код вокруг него по id блока: prompt_toolkit перерисовывает окно
+        # на каждое нажатие и изменение размера, а файл читается и разбирается только при первом показе блока.
+        # id не меняется при фильтрации и поиске — блоки те же словари из grouped
+        block_fragments = {}
+        def render_block(block):
+            lines = [('class:title', 'Комментарий:\n')]
+            lines.extend(('class:comment', pretty + '\n') for pretty in map(clean_comment_for_display, block['lines']) if pretty)
+            lines.append(('class:title', 'Код вокруг комментария:\n'))
+            # rich в окне prompt_toolkit не используется: код подсвечивается по маркерам комментариев
+            code, start_line, _ = preview_code_around_comment(block, context=3)
+            code_lines = code.splitlines(keepends=True)
+            # Маркеры комментариев ищутся одним проходом finditer по всему фрагменту; для каждой строки
+            # запоминается позиция первого маркера (строка находится по смещению через bisect)
+            line_starts = list(accumulate(map(len, code_lines), initial=0))
+            first_marker = {}
+            for match in COMMENT_MARKER_RE.finditer(code):
+                i = bisect_right(line_starts, match.start()) - 1
+                if i not in first_marker:
+                    first_marker[i] = match.start() - line_starts[i]
+            for i, line in enumerate(code_lines):
+                lineno = start_line + i
+                line = line.rstrip('\n')
+                # Если в строке есть комментарий, выделяем только его часть
+                start = first_marker.get(i)
+                if start is not None:
+                    lines += (('class:code', f'{lineno:>4} | {line[:start]}'), ('class:comment', line[start:] + '\n'))
+                else:
+                    lines.append(('class:code', f'{lineno:>4} | {line}\n'))
+            return lines
+        # Готовый кадр текущего блока: его строят обработчики клавиш, а render только возвращает.
+        # Кэшируются лишь удачно построенные кадры — после ошибки кадр строится заново
+        current_frame = [None]
+        def build_frame():
+            current_frame[0] = None
             try:
                 block = get_current_block()
                 if (not filtered[0] or
@@ -1403,53 +2150,54 @@ def interactive_viewer(grouped):
                     not isinstance(block.get('start_line'), int)):
                     idx[0] = 0
                     return [('', 'Нет комментариев для отображения.\n[→] Next  [←] Prev  [F]ilter  [S]earch  [O]pen file  [A]ll open  [E]xport  [C]opy code  [G]o to  [Q]uit')]
-                lines = []
-                lines.append(('class:title', f'Всего блоков: {len(filtered[0])} | Текущий: {idx[0]+1 if filtered[0] else 0}\n'))
-                lines.append(('class:title', f'Файл: {block["file"]}  Строки: {block["start_line"]}-{block["end_line"]}  Тип: {block["type"]}\n'))
-                lines.append(('class:title', 'Комментарий:\n'))
-                for l in block['lines']:
-                    pretty = clean_comment_for_display(l)
-                    if pretty:
-                        lines.append(('class:comment', pretty + '\n'))
-                lines.append(('class:title', 'Код вокруг комментария:\n'))
-                code, start_line, lang = preview_code_around_comment(block, context=3, use_rich=True) if use_rich else preview_code_around_comment(block, context=3)
-                code_lines = code.splitlines(keepends=True)
-                comment_lines = [line for line in block['lines'] if line.strip()]
-                comment_indices = find_comment_block_in_code([l.rstrip('\n') for l in code_lines], comment_lines)
-                for i, line in enumerate(code_lines):
-                    lineno = f'{start_line + i:>4} | '
-                    # Если в строке есть комментарий, выделяем только его часть
-                    comment_match = re.search(r'(//|#|/\*|<!--|-->)', line)
-                    if comment_match:
-                        start = comment_match.start()
-                        before = line[:start]
-                        comment = line[start:].rstrip('\n')
-                        lines.append(('class:code', lineno + before))
-                        lines.append(('class:comment', comment + '\n'))
-                    else:
-                        lines.append(('class:code', lineno + line.rstrip('\n') + '\n'))
+                lines = [
+                    ('class:title', f'Всего блоков: {len(filtered[0])} | Текущий: {idx[0]+1 if filtered[0] else 0}\n'),
+                    ('class:title', f'Файл: {block["file"]}  Строки: {block["start_line"]}-{block["end_line"]}  Тип: {block["type"]}\n'),
+                ]
+                fragments = block_fragments.get(id(block))
+                if fragments is None:
+                    fragments = block_fragments[id(block)] = render_block(block)
+                lines.extend(fragments)
                 lines.append(('', '\n[→] Next  [←] Prev  [F]ilter  [S]earch  [O]pen file  [A]ll open  [E]xport  [C]opy code  [G]o to  [Q]uit'))
+                current_frame[0] = lines
                 return lines
             except Exception as e:
                 idx[0] = 0
                 return [('', f'Нет комментариев для отображения (ошибка: {e}).\n[→] Next  [←] Prev  [F]ilter  [S]earch  [O]pen file  [A]ll open  [E]xport  [C]opy code  [G]o to  [Q]uit')]
+        def render():
+            return current_frame[0] or build_frame()
+        async def warm_neighbours():
+            # Соседние блоки готовятся после отрисовки текущего, пока пользователь его читает:
+            # следующее нажатие стрелки не ждёт чтения файла
+            await asyncio.sleep(0)
+            blocks = filtered[0]
+            for j in (idx[0] + 1, idx[0] - 1):
+                if not blocks:
+                    return
+                block = blocks[j % len(blocks)]
+                if id(block) not in block_fragments:
+                    try:
+                        block_fragments[id(block)] = render_block(block)
+                    except Exception:
+                        pass
+        def move(event, step):
+            if filtered[0]:
+                idx[0] = (idx[0] + step) % len(filtered[0])
+                build_frame()
+                event.app.invalidate()
+                event.app.create_background_task(warm_neighbours())
         kb = KeyBindings()
         @kb.add('right')
         def _(event):
-            if filtered[0]:
-                idx[0] = (idx[0] + 1) % len(filtered[0])
-                event.app.invalidate()
+            move(event, 1)
         @kb.add('left')
         def _(event):
-            if filtered[0]:
-                idx[0] = (idx[0] - 1) % len(filtered[0])
-                event.app.invalidate()
+            move(event, -1)
         @kb.add('q')
         def _(event):
             event.app.exit()
         @kb.add('f')
         async def _(event):
-            from prompt_toolkit.shortcuts.dialogs import checkboxlist_dialog
             allowed_types = [
                 ('single', 'single'),
                 ('multi', 'multi'),
@@ -1463,36 +2211,45 @@ def interactive_viewer(grouped):
                 values=allowed_types
             ).run_async()
             if result:
-                filtered[0] = [b for b in grouped if b['type'] in result]
+                filtered[0] = [grouped[i] for i, t in enumerate(block_types) if t in result]
+                filtered_files[0] = None
+                current_frame[0] = None
                 idx[0] = 0
                 filter_type[0] = ','.join(result)
             else:
                 filtered[0] = grouped
+                filtered_files[0] = None
+                current_frame[0] = None
                 idx[0] = 0
                 filter_type[0] = None
             event.app.layout.focus(body)
             event.app.invalidate()
         @kb.add('s')
         async def _(event):
-            from prompt_toolkit.shortcuts import input_dialog
             s = await input_dialog(title='Поиск', text='Поиск (пусто — сброс):').run_async()
             if s:
-                filtered[0] = [b for b in grouped if any(s.lower() in line.lower() for line in b['lines'])]
+                if block_text_lower[0] is None:
+                    block_text_lower[0] = ['\n'.join(b['lines']).lower() for b in grouped]
+                s_lower = s.lower()
+                filtered[0] = [grouped[i] for i, text in enumerate(block_text_lower[0]) if s_lower in text]
+                filtered_files[0] = None
+                current_frame[0] = None
                 idx[0] = 0
                 search_term[0] = s
             else:
                 filtered[0] = grouped
+                filtered_files[0] = None
+                current_frame[0] = None
                 idx[0] = 0
                 search_term[0] = ''
             event.app.layout.focus(body)
             event.app.invalidate()
         @kb.add('e')
         async def _(event):
-            from prompt_toolkit.shortcuts import input_dialog
             fmt = await input_dialog(title='Экспорт', text='Формат экспорта (md/csv/txt/html/json/pdf):').run_async()
             fname = await input_dialog(title='Экспорт', text='Имя файла для экспорта:').run_async()
             if fmt in ('md', 'csv', 'txt', 'html', 'json', 'pdf'):
-                generate_report(filtered[0], sorted(set(b['file'] for b in filtered[0])), report_type=fmt, filename=fname)
+                generate_report(filtered[0], get_filtered_files(), report_type=fmt, filename=fname)
             event.app.layout.focus(body)
             event.app.invalidate()
         @kb.add('o')
@@ -1504,29 +2261,17 @@ def interactive_viewer(grouped):
                     if os.name == 'nt':
                         npp_path = r'C:\Program Files\Notepad++\notepad++.exe'
                         if os.path.exists(npp_path):
-                            subprocess.Popen([npp_path, f])
+                            spawn([npp_path, f])
                         else:
                              print('Рекомендуется установить Notepad++ (https://notepad-plus-plus.org/) для удобного редактирования кода и перехода к строкам. Поместите его в C:/Program Files/Notepad++ или добавьте в PATH.')
-                             subprocess.Popen(['notepad.exe', f])
+                             spawn(['notepad.exe', f])
                     else:
-                        subprocess.Popen(['xdg-open', f])
+                        spawn(['xdg-open', f])
                 except Exception as e:
                     pass
         @kb.add('a')
         def _(event):
-            files = sorted(set(b['file'] for b in filtered[0]))
-            for f in files:
-                try:
-                    if os.name == 'nt':
-                        npp_path = r'C:\Program Files\Notepad++\notepad++.exe'
-                        if os.path.exists(npp_path):
-                            subprocess.Popen([npp_path, f])
-                        else:
-                            subprocess.Popen(['notepad.exe', f])
-                    else:
-                        subprocess.Popen(['xdg-open', f])
-                except Exception as e:
-                    pass
+            open_files(get_filtered_files())
         @kb.add('c')
         def _(event):
             block = get_current_block()
@@ -1536,12 +2281,12 @@ def interactive_viewer(grouped):
                     lineno = f'{block["start_line"] + i:>4} | '
                     for_copy.append(lineno + line)
                 selected_code = '\n'.join(for_copy)
+                if pyperclip is None:
+                    print(f'pyperclip не установлен. Код для копирования:\n{selected_code}')
+                    return
                 try:
-                    import pyperclip
                     pyperclip.copy(selected_code)
                     print(f'Код скопирован в буфер обмена.')
-                except ImportError:
-                    print(f'pyperclip не установлен. Код для копирования:\n{selected_code}')
                 except Exception as e:
                     print(f'Ошибка копирования в буфер обмена: {e}\nКод для копирования:\n{selected_code}')
         @kb.add('g')
@@ -1551,25 +2296,21 @@ def interactive_viewer(grouped):
                 return
             f = os.path.abspath(block['file'])
             line = block['start_line']
-            import shutil
-            debug_path = 'find_comments.debug'
-            with open(debug_path, 'a', encoding='utf-8') as dbg:
-                dbg.write(f'Trying to open file: {f} (exists: {os.path.exists(f)})\n')
+            write_debug(f'Trying to open file: {f} (exists: {os.path.exists(f)})')
             try:
+                editor, command = find_editor()
                 # Notepad++ (default)
-                if os.name == 'nt':
-                    npp = shutil.which('notepad++')
-                    npp_path = r'C:\Program Files\Notepad++\notepad++.exe'
+                if editor == 'notepad++':
                     # Определяем строку и позицию первого комментария в коде вокруг
                     code, start_line, lang = preview_code_around_comment(block, context=3)
                     code_lines = code.splitlines(keepends=False)
                     comment_lines = [line for line in block['lines'] if line.strip()]
-                    comment_indices = sorted(find_comment_block_in_code([l.rstrip('\n') for l in code_lines], comment_lines))
-                    if comment_indices:
-                        goto_line = start_line + comment_indices[0]
+                    first_index = find_first_comment_block_index(code_lines, comment_lines)
+                    if first_index is not None:
+                        goto_line = start_line + first_index
                         # Найти позицию первого символа комментария в строке
-                        comment_line = code_lines[comment_indices[0]]
-                        match = re.search(r'(//|#|/\*|<!--|-->)', comment_line)
+                        comment_line = code_lines[first_index]
+                        match = COMMENT_MARKER_RE.search(comment_line)
                         if match:
                             goto_col = match.start() + 1  # Notepad++ columns start at 1
                         else:
@@ -1577,47 +2318,36 @@ def interactive_viewer(grouped):
                     else:
                         goto_line = block['start_line']
                         goto_col = 1
-                    if npp:
-                        with open(debug_path, 'a', encoding='utf-8') as dbg:
-                            dbg.write(f'Opening with Notepad++ from PATH: notepad++ -n{goto_line} -c{goto_col} {f}\n')
-                        subprocess.Popen(['notepad++', f'-n{goto_line}', f'-c{goto_col}', f])
-                        return
-                    elif os.path.exists(npp_path):
-                        with open(debug_path, 'a', encoding='utf-8') as dbg:
-                            dbg.write(f'Opening with Notepad++ from default path: {npp_path} -n{goto_line} -c{goto_col} {f}\n')
-                        subprocess.Popen([npp_path, f'-n{goto_line}', f'-c{goto_col}', f])
-                        return
+                    if command == 'notepad++':
+                        write_debug(f'Opening with Notepad++ from PATH: notepad++ -n{goto_line} -c{goto_col} {f}')
+                    else:
+                        write_debug(f'Opening with Notepad++ from default path: {command} -n{goto_line} -c{goto_col} {f}')
+                    spawn([command, f'-n{goto_line}', f'-c{goto_col}', f])
+                    return
                 # VS Code
-                if shutil.which('code'):
-                    with open(debug_path, 'a', encoding='utf-8') as dbg:
-                        dbg.write(f'Opening with VS Code: code -g {f}:{line}\n')
-                    subprocess.Popen(['code', '-g', f'{f}:{line}'])
+                if editor == 'code':
+                    write_debug(f'Opening with VS Code: code -g {f}:{line}')
+                    spawn(['code', '-g', f'{f}:{line}'])
                     return
                 # Sublime Text
-                if shutil.which('subl'):
-                    with open(debug_path, 'a', encoding='utf-8') as dbg:
-                        dbg.write(f'Opening with Sublime Text: subl {f}:{line}\n')
-                    subprocess.Popen(['subl', f'{f}:{line}'])
+                if editor == 'subl':
+                    write_debug(f'Opening with Sublime Text: subl {f}:{line}')
+                    spawn(['subl', f'{f}:{line}'])
                     return
                 # gedit (Linux)
-                if shutil.which('gedit'):
-                    with open(debug_path, 'a', encoding='utf-8') as dbg:
-                        dbg.write(f'Opening with gedit: gedit +{line} {f}\n')
-                    subprocess.Popen(['gedit', f'+{line}', f])
+                if editor == 'gedit':
+                    write_debug(f'Opening with gedit: gedit +{line} {f}')
+                    spawn(['gedit', f'+{line}', f])
                     return
                 # Fallback: просто открыть файл
                 if os.name == 'nt':
-                    with open(debug_path, 'a', encoding='utf-8') as dbg:
-                        dbg.write(f'Fallback: could not find any editor, tried notepad.exe {f}\n')
-                    subprocess.Popen(['notepad.exe', f], shell=True)
+                    write_debug(f'Fallback: could not find any editor, tried notepad.exe {f}')
+                    spawn(['notepad.exe', f], shell=True)
                 else:
-                    with open(debug_path, 'a', encoding='utf-8') as dbg:
-                        dbg.write(f'Fallback: xdg-open {f}\n')
-                    subprocess.Popen(['xdg-open', f])
+                    write_debug(f'Fallback: xdg-open {f}')
+                    spawn(['xdg-open', f])
             except Exception as e:
-                from prompt_toolkit.shortcuts import message_dialog
-                with open(debug_path, 'a', encoding='utf-8') as dbg:
-                    dbg.write(f'Failed to open file: {f} | Error: {e}\n')
+                write_debug(f'Failed to open file: {f} | Error: {e}')
                 await message_dialog(title='Ошибка', text=f'Не удалось открыть файл: {e}').run_async()
         @kb.add('q')
         def _(event):
@@ -1626,49 +2356,49 @@ def interactive_viewer(grouped):
         frame = Frame(body, title='find_comments.py — Interactive')
         layout = Layout(HSplit([frame]))
         app = Application(layout=layout, key_bindings=kb, style=style, full_screen=True)
-        app.run()
+        try:
+            app.run()
+        finally:
+            if debug_log[0] is not None:
+                debug_log[0].close()
     except Exception:
         # fallback на старый режим
-        import os
-        import subprocess
         idx = 0
         filtered = grouped
+        filtered_files = None
         filter_type = None
-        def find_comment_block_in_code_simple(code_lines, comment_lines):
-            indices = set()
-            if not comment_lines:
-                return indices
-            code_stripped = [line.strip() for line in code_lines]
-            comment_stripped = [line.strip() for line in comment_lines if line.strip()]
-            n = len(code_stripped)
-            m = len(comment_stripped)
-            for i in range(n - m + 1):
-                if code_stripped[i:i+m] == comment_stripped:
-                    indices.update(range(i, i+m))
-            return indices
+        if os.name == 'nt':
+            # Старая консоль Windows понимает ANSI-последовательности только после включения режима VT
+            try:
+                from colorama import just_fix_windows_console
+                just_fix_windows_console()
+            except ImportError:
+                pass
         while True:
-            os.system('cls' if os.name == 'nt' else 'clear')
-            print(f'Всего блоков: {len(filtered)} | Текущий: {idx+1 if filtered else 0}')
+            # Кадр собирается целиком и выводится одной записью вместе с очисткой экрана
+            frame = [CLEAR_SCREEN, f'Всего блоков: {len(filtered)} | Текущий: {idx+1 if filtered else 0}\n']
             if not filtered:
-                print('Нет комментариев для отображения.')
+                frame.append('Нет комментариев для отображения.\n')
             else:
                 block = filtered[idx]
-                print(f'Файл: {block["file"]}  Строки: {block["start_line"]}-{block["end_line"]}  Тип: {block["type"]}')
-                print('-' * 60)
-                print('\n'.join(block['lines']))
-                print('-' * 60)
+                frame.append(f'Файл: {block["file"]}  Строки: {block["start_line"]}-{block["end_line"]}  Тип: {block["type"]}\n')
+                frame.append('-' * 60 + '\n')
+                frame.append(block_text(block) + '\n')
+                frame.append('-' * 60 + '\n')
                 code, start_line, _ = preview_code_around_comment(block, context=3)
                 code_lines = code.splitlines(keepends=True)
                 comment_lines = [line for line in block['lines'] if line.strip()]
-                comment_indices = find_comment_block_in_code_simple([l.rstrip('\n') for l in code_lines], comment_lines)
-                print('Код вокруг комментария:')
+                comment_indices = find_comment_block_in_code(code_lines, comment_lines)
+                frame.append('Код вокруг комментария:\n')
                 for i, line in enumerate(code_lines):
                     lineno = f'{start_line + i:>4} | '
                     if i in comment_indices:
-                        print('\033[92m' + lineno + line.rstrip('\n') + '\033[0m')
+                        frame.append('\033[92m' + lineno + line.rstrip('\n') + '\033[0m\n')
                     else:
-                        print(lineno + line.rstrip('\n'))
-            print('[N]ext  [P]rev  [F]ilter type  [O]pen file  [A] Open all  [E] Export  [Q]uit  [C]opy code')
+                        frame.append(lineno + line.rstrip('\n') + '\n')
+            frame.append('[N]ext  [P]rev  [F]ilter type  [O]pen file  [A] Open all  [E] Export  [Q]uit  [C]opy code\n')
+            sys.stdout.write(''.join(frame))
+            sys.stdout.flush()
             cmd = input('> ').strip().lower()
             if cmd == 'n' and filtered:
                 idx = (idx + 1) % len(filtered)
@@ -1678,10 +2408,12 @@ def interactive_viewer(grouped):
                 t = input('Тип (оставьте пустым для сброса): ').strip()
                 if t:
                     filtered = [b for b in grouped if b['type'] == t]
+                    filtered_files = None
                     idx = 0
                     filter_type = t
                 else:
                     filtered = grouped
+                    filtered_files = None
                     idx = 0
                     filter_type = None
             elif cmd == 'o' and filtered:
@@ -1691,34 +2423,29 @@ def interactive_viewer(grouped):
                     if os.name == 'nt':
                         npp_path = r'C:\Program Files\Notepad++\notepad++.exe'
                         if os.path.exists(npp_path):
-                            subprocess.Popen([npp_path, f])
+                            spawn([npp_path, f])
                         else:
-                            subprocess.Popen(['notepad.exe', f])
+                            spawn(['notepad.exe', f])
                     else:
-                        subprocess.Popen(['xdg-open', f])
+                        spawn(['xdg-open', f])
                 except Exception as e:
                     print(f'Ошибка открытия файла: {e}')
                     input('Нажмите Enter...')
             elif cmd == 'a':  # массовое открытие
-                files = sorted(set(b['file'] for b in filtered))
-                for f in files:
-                    try:
-                        if os.name == 'nt':
-                            npp_path = r'C:\Program Files\Notepad++\notepad++.exe'
-                            if os.path.exists(npp_path):
-                                subprocess.Popen([npp_path, f])
-                            else:
-                                subprocess.Popen(['notepad.exe', f])
-                        else:
-                            subprocess.Popen(['xdg-open', f])
-                    except Exception as e:
+                if filtered_files is None:
+                    filtered_files = sorted({b['file'] for b in filtered})
+                files = filtered_files
+                for e in open_files(files):
+                    if e is not None:
                         print(f'Ошибка открытия файла: {e}')
                 input(f'Открыто файлов: {len(files)}. Нажмите Enter...')
             elif cmd == 'e':  # быстрый экспорт
                 fmt = input('Формат экспорта (md/csv/txt/html/json/pdf): ').strip()
                 fname = input('Имя файла для экспорта: ').strip()
                 if fmt in ('md', 'csv', 'txt', 'html', 'json', 'pdf'):
-                    generate_report(filtered, sorted(set(b['file'] for b in filtered)), report_type=fmt, filename=fname)
+                    if filtered_files is None:
+                        filtered_files = sorted({b['file'] for b in filtered})
+                    generate_report(filtered, filtered_files, report_type=fmt, filename=fname)
                     input(f'Экспортировано в {fname}. Нажмите Enter...')
                 else:
                     input('Неподдерживаемый формат. Нажмите Enter...')
@@ -1729,20 +2456,25 @@ def interactive_viewer(grouped):
                 code, start_line, lang = preview_code_around_comment(block, context=3, use_rich=True)
                 code_lines = code.splitlines(keepends=True)
                 comment_lines = [line for line in block['lines'] if line.strip()]
-                comment_indices = find_comment_block_in_code([l.rstrip('\n') for l in code_lines], comment_lines)
+                comment_indices = find_comment_block_in_code(code_lines, comment_lines)
                 selected_lines = [f'{start_line + i:>4} | ' for i, line in enumerate(code_lines) if i in comment_indices]
                 selected_code = '\n'.join(selected_lines)
-                try:
-                    import pyperclip
+                if pyperclip is None:
+                    print(f'Код для копирования: {selected_code}')
+                else:
                     pyperclip.copy(selected_code)
                     print(f'Код скопирован в буфер обмена: {selected_code}')
-                except ImportError:
-                    print(f'Код для копирования: {selected_code}')
 
 def clean_comment_for_display(line):
-    # Удаляем символы комментариев и XML/HTML-теги
-    line = re.sub(r'^\s*(///+|//+|#+|/\*+|\*+/|<!--+|-->|<summary>|</summary>)', '', line, flags=re.IGNORECASE)
-    line = re.sub(r'<.*?>', '', line)
+    # Удаляем символы комментариев и XML/HTML-теги. Без '<' тегов в строке нет, а символы комментария
+    # могут стоять только в начале — если первый непробельный символ не из них, строка уже чистая
+    if '<' not in line:
+        stripped = line.strip()
+        if not stripped or stripped[0] not in '/#*-':
+            return stripped
+        return DISPLAY_PREFIX_RE.sub('', line).strip()
+    line = DISPLAY_PREFIX_RE.sub('', line)
+    line = DISPLAY_TAG_RE.sub('', line)
     return line.strip()
 
 if __name__ == '__main__':